@@ -0,0 +1,12 @@
+"""
+    benchmarks
+    ~~~~~~~~~~
+    Offline benchmarks for graphlite. Run the whole suite
+    and write the results as JSON with::
+
+        $ python -m benchmarks --edges 1000000 --output before.json
+
+    and compare two runs with::
+
+        $ python -m benchmarks.compare before.json after.json
+"""
@@ -0,0 +1,50 @@
+import argparse
+import json
+import sys
+
+from benchmarks import suite
+from benchmarks.generators import GENERATORS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--generator', choices=sorted(GENERATORS),
+                        default='power_law')
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--edges', type=int, default=100000)
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-bulk', dest='bulk', action='store_false',
+                        help='ingest with a transaction, not bulk_load')
+    parser.add_argument('--only', nargs='*',
+                        help='names of the benchmarks to run')
+    parser.add_argument('--output', help='write the JSON results here')
+    args = parser.parse_args(argv)
+
+    results = suite.run(
+        generator=args.generator,
+        nodes=args.nodes,
+        edges=args.edges,
+        samples=args.samples,
+        seed=args.seed,
+        bulk=args.bulk,
+        only=args.only,
+    )
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    print('%-18s %14s %10s %10s %12s' % (
+        'benchmark', 'ops/s', 'p50 ms', 'p99 ms', 'peak KiB'))
+    for name, result in sorted(results['results'].items()):
+        print('%-18s %14.1f %10.3f %10.3f %12.1f' % (
+            name,
+            result['throughput'] or 0,
+            result['p50_ms'],
+            result['p99_ms'],
+            result['peak_memory_bytes'] / 1024.0,
+        ))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
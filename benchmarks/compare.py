@@ -0,0 +1,41 @@
+"""
+    Compares two JSON files written by ``python -m
+    benchmarks --output`` and prints the change in
+    throughput and latency of every benchmark::
+
+        $ python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+
+
+def change(before, after):
+    if not before:
+        return float('nan')
+    return (after - before) / before * 100
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as fp:
+        before = json.load(fp)['results']
+    with open(args.after) as fp:
+        after = json.load(fp)['results']
+
+    print('%-18s %12s %12s' % ('benchmark', 'ops/s', 'p99'))
+    for name in sorted(set(before) & set(after)):
+        old, new = before[name], after[name]
+        print('%-18s %+11.1f%% %+11.1f%%' % (
+            name,
+            change(old['throughput'] or 0, new['throughput'] or 0),
+            change(old['p99_ms'], new['p99_ms']),
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+    Synthetic graph generators. Every generator yields
+    ``(src, dst)`` pairs and is deterministic for a given
+    seed, so that results are comparable across commits.
+"""
+
+import bisect
+import itertools
+import random
+
+
+def uniform(nodes, edges, seed=0):
+    """
+    Yields *edges* edges between uniformly chosen nodes
+    in ``range(nodes)``.
+
+    :param nodes: The number of nodes.
+    :param edges: The number of edges.
+    :param seed: The random seed.
+    """
+    rng = random.Random(seed)
+    for __ in range(edges):
+        yield rng.randrange(nodes), rng.randrange(nodes)
+
+
+def power_law(nodes, edges, exponent=2.1, seed=0):
+    """
+    Yields *edges* edges whose endpoints follow a Zipf
+    distribution with the given *exponent*, so that a few
+    hub nodes have most of the edges, similar to social
+    and web graphs.
+
+    :param nodes: The number of nodes.
+    :param edges: The number of edges.
+    :param exponent: The exponent of the distribution.
+    :param seed: The random seed.
+    """
+    rng = random.Random(seed)
+    weights = [1.0 / (rank ** (exponent - 1)) for rank in range(1, nodes + 1)]
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    # shuffle the ranks so that hubs are not always the lowest ids
+    ids = list(range(nodes))
+    rng.shuffle(ids)
+
+    def pick():
+        return ids[bisect.bisect_left(cumulative, rng.random() * total)]
+
+    for __ in range(edges):
+        yield pick(), rng.randrange(nodes) if rng.random() < 0.5 else pick()
+
+
+GENERATORS = {
+    'uniform': uniform,
+    'power_law': power_law,
+}
@@ -0,0 +1,201 @@
+"""
+    The benchmarks. Every benchmark takes a graph and
+    the list of nodes to sample, and returns a callable
+    which runs a single operation for a given node.
+"""
+
+import gc
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from graphlite import connect, V
+
+from benchmarks.generators import GENERATORS
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def measure(operation, samples, rerun=None):
+    """
+    Runs *operation* once per sample and returns the
+    throughput, latency percentiles and peak memory.
+    The peak memory is measured in a second pass, so
+    that tracing allocations does not slow down the
+    timed one.
+
+    :param operation: A callable taking a sample.
+    :param samples: The samples.
+    :param rerun: The samples of the second pass, for
+        operations which cannot run twice on the same
+        samples. Defaults to *samples*.
+    """
+    gc.collect()
+    latencies = []
+    start = time.perf_counter()
+    for sample in samples:
+        began = time.perf_counter()
+        operation(sample)
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    for sample in samples if rerun is None else rerun:
+        operation(sample)
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'operations': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else None,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_memory_bytes': peak,
+    }
+
+
+def ingest(directory, pairs, count, bulk):
+    """
+    Streams the *count* edges yielded by *pairs* into
+    fresh graphs in *directory*, one timed and one to
+    measure the peak memory of, and returns the timed
+    graph along with the measurements.
+    """
+    graphs = []
+
+    def load(name):
+        graph = connect(os.path.join(directory, name), graphs=['knows'],
+                        profile='fast')
+        graphs.append(graph)
+        edges = (V(src).knows(dst) for src, dst in pairs())
+        if bulk:
+            graph.bulk_load(edges)
+        else:
+            with graph.transaction() as tr:
+                tr.store_many(edges)
+
+    result = measure(load, ['graph.db'], rerun=['memory.db'])
+    result['throughput'] = count / result['seconds']
+    graph, memory = graphs
+    memory.close()
+    return graph, result
+
+
+def lookups(graph, nodes):
+    return {
+        'forwards': lambda node: graph.find(V(node).knows).to(list),
+        'inverse': lambda node: graph.find(V().knows(node)).to(list),
+        'contains': lambda node: V(node).knows(node + 1) in graph,
+        'count': lambda node: graph.find(V(node).knows).count(),
+    }
+
+
+def traversals(graph, nodes):
+    def hops(count):
+        def run(node):
+            query = graph.find(V(node).knows)
+            for __ in range(count - 1):
+                query = query.traverse(V().knows)
+            return query.count()
+        return run
+
+    return {
+        'traverse_2': hops(2),
+        'traverse_3': hops(3),
+        'traverse_until_3': lambda node: graph.find(V(node).knows)
+        .traverse_until(V().knows, depth=3).count(),
+    }
+
+
+def set_operations(graph, nodes):
+    def other(node):
+        return nodes[hash(node) % len(nodes)]
+
+    return {
+        'intersection': lambda node: graph.find(V(node).knows)
+        .intersection(V().knows(other(node))).to(list),
+        'union': lambda node: graph.find(V(node).knows)
+        .union(V(other(node)).knows).to(list),
+        'difference': lambda node: graph.find(V(node).knows)
+        .difference(V(other(node)).knows).to(list),
+    }
+
+
+GROUPS = (lookups, traversals, set_operations)
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def run(generator='power_law', nodes=10000, edges=100000, samples=1000,
+        seed=0, bulk=True, only=None):
+    """
+    Generates a graph and runs every benchmark on it,
+    returning a JSON-serialisable dictionary.
+
+    :param generator: The name of the graph generator.
+    :param nodes: The number of nodes.
+    :param edges: The number of edges.
+    :param samples: The number of operations to run for
+        every benchmark.
+    :param seed: The random seed.
+    :param bulk: Whether to ingest with ``bulk_load``.
+    :param only: Names of the benchmarks to run, or
+        ``None`` to run all of them.
+    """
+    generate = GENERATORS[generator]
+    directory = tempfile.mkdtemp(prefix='graphlite-bench-')
+    try:
+        graph, result = ingest(directory,
+                               lambda: generate(nodes, edges, seed=seed),
+                               edges, bulk)
+        results = {'ingest': result}
+
+        # edges are independent, so the sources of a fresh stream are a
+        # degree-biased sample of the nodes, much like real traffic
+        sampled = [src for src, __ in generate(nodes, samples, seed=seed + 1)]
+        for group in GROUPS:
+            for name, operation in sorted(group(graph, sampled).items()):
+                if only and name not in only:
+                    continue
+                results[name] = measure(operation, sampled)
+        graph.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'environment': environment(),
+        'parameters': {
+            'generator': generator,
+            'nodes': nodes,
+            'edges': edges,
+            'samples': samples,
+            'seed': seed,
+            'bulk': bulk,
+        },
+        'results': results,
+    }
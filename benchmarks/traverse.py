@@ -0,0 +1,59 @@
+"""
+    Compares the ``JOIN`` and ``NESTED`` traversal
+    strategies on a random graph at 2 to 6 hops::
+
+        $ python -m benchmarks.traverse --nodes 20000 --edges 200000
+"""
+
+import argparse
+import random
+import time
+
+from graphlite import connect, V
+from graphlite.query import JOIN, NESTED
+
+
+def build(nodes, edges, seed):
+    rng = random.Random(seed)
+    graph = connect(':memory:', graphs=['knows'])
+    graph.bulk_load(
+        V(rng.randrange(nodes)).knows(rng.randrange(nodes))
+        for __ in range(edges)
+    )
+    return graph
+
+
+def timed(query, repeat):
+    best = float('inf')
+    rows = 0
+    for __ in range(repeat):
+        start = time.perf_counter()
+        rows = query.count()
+        best = min(best, time.perf_counter() - start)
+    return best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--nodes', type=int, default=20000)
+    parser.add_argument('--edges', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    graph = build(args.nodes, args.edges, args.seed)
+    print('%4s  %12s  %12s  %10s' % ('hops', 'join (s)', 'nested (s)', 'rows'))
+    for hops in range(2, 7):
+        results = []
+        for strategy in (JOIN, NESTED):
+            query = graph.find(V(0).knows)
+            for __ in range(hops - 1):
+                query = query.traverse(V().knows, strategy=strategy)
+            results.append(timed(query, args.repeat))
+        (join, rows), (nested, __) = results
+        print('%4d  %12.4f  %12.4f  %10d' % (hops, join, nested, rows))
+    graph.close()
+
+
+if __name__ == '__main__':
+    main()
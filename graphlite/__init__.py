@@ -13,12 +13,57 @@ from graphlite.graph import Graph
 from graphlite.query import V
 
 
-def connect(uri, graphs=()):
+def connect(uri, graphs=(), layout='rowid', pool_size=0, arraysize=256,
+            profile=None, readonly=False, mmap=None, adjacency_cache=0,
+            slow_query=None, degrees=False, intern_nodes=False,
+            node_cache=65536, create_relations=False):
     """
     Returns a Graph object with the given *uri* and
     created *graphs*.
 
     :param uri: The URI to the SQLite DB.
-    :param graphs: The graphs to create.
+    :param graphs: The graphs to create, or a dictionary
+        mapping them to the types of their edge
+        properties, e.g. ``{'follows': {'since': 'INTEGER'}}``.
+    :param layout: The storage layout, ``'rowid'`` or
+        ``'clustered'``. Clustered graphs are stored in
+        ``WITHOUT ROWID`` tables keyed on the edge, and
+        ignore duplicate edges.
+    :param pool_size: The number of read-only connections
+        to pool for use by multiple threads, if any.
+    :param arraysize: The number of rows fetched at a
+        time when iterating over queries.
+    :param profile: A performance profile, one of
+        ``'durable'``, ``'fast'``, ``'bulk'`` or, for
+        read-only graphs, ``'readonly'``.
+    :param readonly: Whether to open the database as a
+        read-only, immutable snapshot.
+    :param mmap: The number of bytes to memory-map.
+    :param adjacency_cache: The number of single-hop
+        query results to cache in memory, if any.
+    :param slow_query: The threshold in seconds above
+        which statements are logged as slow, if any.
+    :param degrees: Whether to keep the degree of every
+        node in a table, see :meth:`Graph.degree`.
+    :param intern_nodes: Whether to store node keys once
+        and refer to them by integer ids in the edges.
+    :param node_cache: The number of node id translations
+        to cache, if nodes are interned.
+    :param create_relations: Whether to create relations
+        the first time edges of them are stored.
     """
-    return Graph(uri, graphs)
+    return Graph(
+        uri, graphs,
+        layout=layout,
+        pool_size=pool_size,
+        arraysize=arraysize,
+        profile=profile,
+        readonly=readonly,
+        mmap=mmap,
+        adjacency_cache=adjacency_cache,
+        slow_query=slow_query,
+        degrees=degrees,
+        intern_nodes=intern_nodes,
+        node_cache=node_cache,
+        create_relations=create_relations,
+    )
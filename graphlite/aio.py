@@ -0,0 +1,419 @@
+"""
+    graphlite.aio
+    ~~~~~~~~~~~~~
+    An asyncio front-end to graphlite. Every SQLite
+    call is ran on a dedicated executor so that the
+    event loop is never blocked, while queries are
+    still built by :mod:`graphlite.query`. Slices of
+    async queries cannot have a step.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from graphlite.graph import Graph
+from graphlite.transaction import AbortSignal
+import graphlite.sql as SQL
+
+
+async def connect(uri, graphs=(), batch_size=256, **kwargs):
+    """
+    Returns an :class:`AsyncGraph` with the given *uri*
+    and created *graphs*. Other keyword arguments are
+    passed to :func:`graphlite.connect`.
+
+    :param uri: The URI to the SQLite DB.
+    :param graphs: The graphs to create.
+    :param batch_size: The number of rows fetched at a
+        time when iterating over queries.
+    """
+    workers = max(1, kwargs.get('pool_size', 0))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    loop = asyncio.get_running_loop()
+    try:
+        graph = await loop.run_in_executor(executor, lambda: Graph(
+            uri, graphs, check_same_thread=False, **kwargs))
+    except BaseException:
+        executor.shutdown(wait=False)
+        raise
+    return AsyncGraph(graph, executor, batch_size)
+
+
+class AsyncGraph(object):
+    """
+    Wraps a :class:`graphlite.graph.Graph` which is
+    only used from the threads of the *executor*. If
+    the graph has a connection pool there may be as
+    many threads as pooled connections, otherwise the
+    executor must have a single thread.
+
+    :param graph: The graph.
+    :param executor: The executor.
+    :param batch_size: The number of rows fetched at a
+        time when iterating over queries.
+    """
+
+    def __init__(self, graph, executor, batch_size=256):
+        self.graph = graph
+        self.executor = executor
+        self.batch_size = batch_size
+
+    def run(self, func, *args):
+        """
+        Runs ``func(*args)`` on the executor and returns
+        an awaitable of its result.
+
+        :param func: The callable.
+        :param args: The arguments.
+        """
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, func, *args)
+
+    async def close(self):
+        """
+        Closes the graph and shuts the executor down.
+        """
+        await self.run(self.graph.close)
+        self.executor.shutdown()
+
+    async def contains(self, edge):
+        """
+        Checks if an edge exists within the database,
+        similar to ``edge in graph``.
+
+        :param edge: The edge to query.
+        """
+        return await self.run(self.graph.__contains__, edge)
+
+    async def neighbors_many(self, nodes, rel, inverse=False):
+        """
+        See :meth:`graphlite.graph.Graph.neighbors_many`.
+        """
+        return await self.run(self.graph.neighbors_many,
+                              list(nodes), rel, inverse)
+
+    async def degree(self, node, rel, direction='out'):
+        """
+        See :meth:`graphlite.graph.Graph.degree`.
+        """
+        return await self.run(self.graph.degree, node, rel, direction)
+
+    async def top_degrees(self, rel, count=10, direction='out'):
+        """
+        See :meth:`graphlite.graph.Graph.top_degrees`.
+        """
+        return await self.run(self.graph.top_degrees, rel, count, direction)
+
+    async def shortest_path(self, src, dst, rel):
+        """
+        See :meth:`graphlite.graph.Graph.shortest_path`.
+        """
+        return await self.run(self.graph.shortest_path, src, dst, rel)
+
+    def find(self, edge_query):
+        """
+        Returns an :class:`AsyncQuery` that acts on the
+        graph. No SQL is executed until the query is
+        awaited or iterated over.
+        """
+        return AsyncQuery(self, self.graph.find(edge_query))
+
+    def transaction(self, profile=None, flush_every=None, checkpoint=False,
+                    progress=None):
+        """
+        Returns an :class:`AsyncTransaction`, or an
+        :class:`AsyncStreamingTransaction` if *flush_every*
+        is given, to be used with ``async with``. See
+        :meth:`graphlite.graph.Graph.transaction`.
+
+        :param profile: The name of a performance profile
+            to switch to while the transaction commits.
+        :param flush_every: The number of edges per batch
+            of a streaming transaction.
+        :param checkpoint: Whether a streaming transaction
+            commits every batch.
+        :param progress: A function called with the number
+            of edges written by a streaming transaction
+            after every batch.
+        """
+        transaction = self.graph.transaction(profile, flush_every,
+                                             checkpoint, progress)
+        if flush_every is None:
+            return AsyncTransaction(self, transaction)
+        return AsyncStreamingTransaction(self, transaction)
+
+
+class AsyncQuery(object):
+    """
+    Wraps a :class:`graphlite.query.Query`. Methods that
+    build queries return new :class:`AsyncQuery` objects
+    while methods that run queries are coroutines, and
+    results can be iterated over with ``async for``.
+
+    :param graph: The :class:`AsyncGraph`.
+    :param query: The query.
+    """
+
+    def __init__(self, graph, query):
+        self.graph = graph
+        self.query = query
+
+    def _wrap(self, query):
+        return AsyncQuery(self.graph, query)
+
+    @property
+    def statement(self):
+        return self.query.statement
+
+    @property
+    def plan(self):
+        return self.query.plan
+
+    def __call__(self, edge):
+        return self._wrap(self.query(edge))
+
+    def traverse(self, edge, **kwargs):
+        return self._wrap(self.query.traverse(edge, **kwargs))
+
+    def traverse_until(self, edge, **kwargs):
+        return self._wrap(self.query.traverse_until(edge, **kwargs))
+
+    @property
+    def intersection(self):
+        return self._wrap(self.query.intersection)
+
+    @property
+    def difference(self):
+        return self._wrap(self.query.difference)
+
+    @property
+    def union(self):
+        return self._wrap(self.query.union)
+
+    async def count(self):
+        return await self.graph.run(self.query.count)
+
+    async def exists(self):
+        return await self.graph.run(self.query.exists)
+
+    async def first(self):
+        return await self.graph.run(self.query.first)
+
+    async def depths(self, edge, **kwargs):
+        return await self.graph.run(
+            lambda: self.query.depths(edge, **kwargs))
+
+    async def page(self, after=None, size=100):
+        return await self.graph.run(self.query.page, after, size)
+
+    def __getitem__(self, obj):
+        """
+        Returns an :class:`AsyncQuery` selecting the slice
+        *obj* of the nodes, similar to slicing a query.
+        Slices cannot have a step.
+
+        :param obj: The slice object.
+        """
+        if obj.step not in (None, 1):
+            raise ValueError('slices of async queries cannot have a step')
+        smt, params = SQL.limit(obj.start, obj.stop)
+        return self._wrap(self.query.derived(smt, params))
+
+    async def to(self, datatype):
+        """
+        Fetches every node and converts them into the
+        *datatype*, similar to :meth:`Query.to`.
+
+        :param datatype: The datatype.
+        """
+        return datatype(await self.graph.run(self.query.to, list))
+
+    async def explain(self):
+        """
+        See :meth:`graphlite.query.Query.explain`.
+        """
+        return await self.graph.run(self.query.explain)
+
+    async def parallel(self, processes=None, pool=None):
+        """
+        See :meth:`graphlite.query.Query.parallel`.
+        """
+        return await self.graph.run(self.query.parallel, processes, pool)
+
+    async def to_array(self, typecode='Q'):
+        """
+        See :meth:`graphlite.query.Query.to_array`.
+        """
+        return await self.graph.run(self.query.to_array, typecode)
+
+    async def batches(self, size=None):
+        """
+        Yields the selected nodes in lists of at most
+        *size* nodes, with ``async for``, fetching a
+        batch at a time on the executor.
+
+        :param size: The batch size, which defaults to
+            the ``batch_size`` of the graph.
+        """
+        batches = self.query.batches(size or self.graph.batch_size)
+        try:
+            while True:
+                batch = await self.graph.run(next, batches, None)
+                if batch is None:
+                    break
+                yield batch
+        finally:
+            await self.graph.run(batches.close)
+
+    async def __aiter__(self):
+        async for batch in self.batches():
+            for node in batch:
+                yield node
+
+
+class AsyncTransaction(object):
+    """
+    Wraps a :class:`graphlite.transaction.Transaction`,
+    which is committed on the executor when leaving the
+    ``async with`` block.
+
+    :param graph: The :class:`AsyncGraph`.
+    :param transaction: The transaction.
+    """
+
+    def __init__(self, graph, transaction):
+        self.graph = graph
+        self.transaction = transaction
+
+    def store(self, edge):
+        self.transaction.store(edge)
+
+    def store_many(self, edges):
+        self.transaction.store_many(edges)
+
+    def delete(self, edge):
+        self.transaction.delete(edge)
+
+    def delete_many(self, edges):
+        self.transaction.delete_many(edges)
+
+    def delete_query(self, query, rel, inverse=False):
+        """
+        See :meth:`graphlite.transaction.Transaction.delete_query`.
+
+        :param query: An :class:`AsyncQuery` of the graph.
+        :param rel: The relation.
+        :param inverse: Whether to match destination nodes.
+        """
+        self.transaction.delete_query(query.query, rel, inverse)
+
+    def abort(self):
+        self.transaction.abort()
+
+    async def commit(self):
+        """
+        Commits the stored changes to the database.
+        """
+        await self.graph.run(self.transaction.commit)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        """
+        Commits the transaction if no exceptions were
+        raised and if operations were defined. Ignores
+        ``AbortSignal``.
+        """
+        if not traceback and self.transaction.ops:
+            await self.commit()
+        return isinstance(value, AbortSignal)
+
+
+class AsyncStreamingTransaction(object):
+    """
+    Wraps a :class:`graphlite.transaction.StreamingTransaction`.
+    Its batches are written as edges are passed in, so
+    every method is a coroutine and runs on a thread of
+    its own, which holds the write lock of the graph
+    until the transaction is committed or rolled back.
+
+    :param graph: The :class:`AsyncGraph`.
+    :param transaction: The streaming transaction.
+    """
+
+    def __init__(self, graph, transaction):
+        self.graph = graph
+        self.transaction = transaction
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def run(self, func, *args):
+        """
+        Runs ``func(*args)`` on the thread of the
+        transaction and returns an awaitable of its
+        result.
+
+        :param func: The callable.
+        :param args: The arguments.
+        """
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, func, *args)
+
+    async def store(self, edge):
+        await self.run(self.transaction.store, edge)
+
+    async def store_many(self, edges):
+        await self.run(self.transaction.store_many, edges)
+
+    async def delete(self, edge):
+        await self.run(self.transaction.delete, edge)
+
+    async def delete_many(self, edges):
+        await self.run(self.transaction.delete_many, edges)
+
+    async def delete_query(self, query, rel, inverse=False):
+        """
+        See :meth:`graphlite.transaction.StreamingTransaction.delete_query`.
+
+        :param query: An :class:`AsyncQuery` of the graph.
+        :param rel: The relation.
+        :param inverse: Whether to match destination nodes.
+        """
+        await self.run(self.transaction.delete_query, query.query, rel,
+                       inverse)
+
+    async def flush(self):
+        """
+        Writes the buffered operations as a batch.
+        """
+        await self.run(self.transaction.flush)
+
+    async def abort(self):
+        """
+        Rolls back the transaction and raises an
+        ``AbortSignal``.
+        """
+        await self.run(self.transaction.rollback)
+        raise AbortSignal
+
+    async def commit(self):
+        """
+        Writes the buffered operations and commits the
+        transaction.
+        """
+        await self.run(self.transaction.commit)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        """
+        Commits the transaction if no exceptions were
+        raised, otherwise rolls it back. Ignores
+        ``AbortSignal``.
+        """
+        try:
+            return await self.run(self.transaction.__exit__, type, value,
+                                  traceback)
+        finally:
+            self.executor.shutdown()
@@ -0,0 +1,217 @@
+import sys
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    """
+    A bounded mapping which evicts the least recently
+    used keys once it holds more than *maxsize* items,
+    and counts cache hits and misses.
+
+    :param maxsize: The maximum number of items. A
+        cache with a size of zero stores nothing.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored under *key* and marks
+        it as recently used, or *default* if there is
+        no such key.
+
+        :param key: The key.
+        :param default: The value to return on a miss.
+        """
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores *value* under *key*, evicting the least
+        recently used item if the cache is full.
+
+        :param key: The key.
+        :param value: The value.
+        """
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Removes *key* from the cache and returns its
+        value, or *default* if there is no such key.
+
+        :param key: The key.
+        :param default: The value to return on a miss.
+        """
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def clear(self):
+        """
+        Removes every item from the cache.
+        """
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of hits,
+        misses and items of the cache, and its size.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'items': len(self.data),
+            'maxsize': self.maxsize,
+        }
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class AdjacencyCache(object):
+    """
+    A read-through cache of the nodes selected by
+    single-hop queries, i.e. ``V(src).rel`` and
+    ``V().rel(dst)``, stored as tuples under the key
+    ``(rel, inverse, node)``. Transactions invalidate
+    the keys of the edges they store or delete, and
+    results read while a transaction is writing to a
+    relation are not cached.
+
+    :param maxsize: The maximum number of cached
+        adjacency lists.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.entries = LRUCache(maxsize)
+        self.lock = Lock()
+        self.writers = {}
+        self.epochs = {}
+
+    def lookup(self, key, load):
+        """
+        Returns the tuple of nodes cached under *key*,
+        calling *load* to fetch and cache them if there
+        is no such key.
+
+        :param key: The ``(rel, inverse, node)`` key.
+        :param load: A callable returning an iterable of
+            the nodes.
+        """
+        nodes = self.entries.get(key)
+        if nodes is not None:
+            return nodes
+
+        rel = key[0]
+        with self.lock:
+            epoch = self.epochs.get(rel, 0)
+            busy = rel in self.writers
+        nodes = tuple(load())
+        with self.lock:
+            if not busy and self.epochs.get(rel, 0) == epoch:
+                self.entries.put(key, nodes)
+        return nodes
+
+    def begin(self, rel):
+        """
+        Marks the start of a write to the relation, which
+        stops results of that relation from being cached
+        until :meth:`end` is called.
+
+        :param rel: The relation.
+        """
+        with self.lock:
+            self.writers[rel] = self.writers.get(rel, 0) + 1
+            self.epochs[rel] = self.epochs.get(rel, 0) + 1
+
+    def end(self, rel):
+        """
+        Marks the end of a write to the relation.
+
+        :param rel: The relation.
+        """
+        with self.lock:
+            self.writers[rel] -= 1
+            if not self.writers[rel]:
+                del self.writers[rel]
+            self.epochs[rel] += 1
+
+    def invalidate(self, edge):
+        """
+        Removes the adjacency lists affected by storing
+        or deleting the *edge*. If the edge has no
+        source or destination node, every adjacency list
+        in the other direction of the relation is
+        removed.
+
+        :param edge: The edge.
+        """
+        rel, src, dst = edge.rel, edge.src, edge.dst
+        if src is not None:
+            self.entries.pop((rel, False, src))
+        if dst is not None:
+            self.entries.pop((rel, True, dst))
+        if src is None or dst is None:
+            self.invalidate_relation(
+                rel, None if src is None and dst is None else dst is None)
+
+    def invalidate_relation(self, rel, inverse=None):
+        """
+        Removes every adjacency list of the relation, or
+        only those in one direction.
+
+        :param rel: The relation.
+        :param inverse: Whether to remove inverse lists,
+            or ``None`` for both directions.
+        """
+        with self.entries.lock:
+            stale = [
+                key for key in self.entries.data
+                if key[0] == rel and inverse in (None, key[1])
+            ]
+            for key in stale:
+                del self.entries.data[key]
+
+    def clear(self):
+        """
+        Removes every adjacency list from the cache.
+        """
+        self.entries.clear()
+
+    def stats(self):
+        """
+        Returns the statistics of :meth:`LRUCache.stats`
+        along with the hit rate and the approximate
+        number of bytes used by the cached tuples.
+        """
+        stats = self.entries.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / float(lookups) if lookups else 0.0
+        with self.entries.lock:
+            stats['bytes'] = sum(
+                sys.getsizeof(nodes) for nodes in self.entries.data.values())
+        return stats
@@ -1,44 +1,348 @@
-from contextlib import closing
+import os
+from contextlib import closing, contextmanager
 from sqlite3 import Connection
+from threading import RLock
 
+try:
+    from urllib.parse import quote, unquote
+except ImportError:  # pragma: no cover
+    from urllib import quote, unquote
+
+from graphlite.cache import AdjacencyCache
+from graphlite.hooks import Hooks, SlowQueryLog
+from graphlite.interning import Interner, Node
+from graphlite.pool import ConnectionPool
 from graphlite.query import Query
-from graphlite.transaction import Transaction
+from graphlite.registry import Registry
+from graphlite.transaction import StreamingTransaction, Transaction
+import graphlite.pragmas as PRAGMA
 import graphlite.sql as SQL
 
 
+class ReadOnlyError(Exception):
+    """
+    Raised when trying to modify a read-only graph.
+    """
+    pass
+
+
 class Graph(object):
     """
     Initializes a new Graph object.
 
     :param uri: The URI of the SQLite db.
-    :param graphs: Graphs to create.
+    :param graphs: Graphs to create, or a dictionary
+        mapping them to dictionaries of the names and
+        SQL types of their edge properties, which are
+        added to existing graphs and indexed.
+    :param layout: The storage layout of newly created
+        graphs, either ``'rowid'`` or ``'clustered'``.
+        Existing graphs keep the layout they were
+        created with.
+    :param pool_size: If non-zero, queries are ran on a
+        pool of up to *pool_size* read-only connections
+        which may be shared between threads, and the
+        database is switched to WAL mode so that readers
+        never block on the writer connection.
+    :param check_same_thread: Whether only the creating
+        thread may use the writer connection, as with
+        ``sqlite3.connect``. Always false for pooled
+        graphs.
+    :param arraysize: The number of rows fetched at a
+        time when iterating over queries.
+    :param profile: The name of a performance profile
+        in :data:`graphlite.pragmas.PROFILES` to apply to
+        every connection, or ``None`` to keep the SQLite
+        defaults. The ``readonly`` profile is only for
+        read-only graphs.
+    :param readonly: Whether to open the database as an
+        immutable snapshot. No tables are created, SQLite
+        skips locking, the ``readonly`` profile is used
+        by default and transactions cannot be made. The
+        file must not be modified while it is open.
+    :param mmap: The number of bytes of the database to
+        memory-map, overriding the profile.
+    :param adjacency_cache: If non-zero, the results of
+        up to *adjacency_cache* single-hop queries are
+        cached in memory and invalidated by transactions.
+    :param slow_query: If given, statements taking at
+        least *slow_query* seconds are logged to the
+        ``graphlite.slow`` logger.
+    :param degrees: Whether the degree of every node is
+        kept in a table per relation, updated by triggers
+        as edges are stored and deleted.
+    :param intern_nodes: Whether node keys, such as UUID
+        strings, are stored once in a dictionary table
+        and the edges refer to them by integer ids. Must
+        be the same every time the database is opened,
+        otherwise a ``ValueError`` is raised.
+    :param node_cache: The number of key to id
+        translations to keep in memory, in each
+        direction, if nodes are interned.
+    :param create_relations: Whether storing an edge of
+        a relation which does not exist yet creates it,
+        within the transaction storing it.
     """
-    def __init__(self, uri, graphs=()):
+    def __init__(self, uri, graphs=(), layout=SQL.ROWID,
+                 pool_size=0, check_same_thread=True, arraysize=256,
+                 profile=None, readonly=False, mmap=None,
+                 adjacency_cache=0, slow_query=None, degrees=False,
+                 intern_nodes=False, node_cache=65536,
+                 create_relations=False):
         self.uri = uri
-        self.db = Connection(database=uri)
-        self.setup_sql(graphs)
+        self.graphs = tuple(graphs)
+        self.properties = SQL.property_schema(graphs)
+        self.layout = layout
+        self.degrees = degrees
+        self.readonly = readonly
+        self.arraysize = arraysize
+        self.adjacency = None
+        if adjacency_cache:
+            self.adjacency = AdjacencyCache(adjacency_cache)
+        self.hooks = Hooks()
+        if slow_query is not None:
+            self.hooks.add(SlowQueryLog(slow_query))
+        self.interner = None
+        if intern_nodes:
+            self.interner = Interner(node_cache, hooks=self.hooks)
+        self.registry = Registry(layout, self.properties, degrees,
+                                 hooks=self.hooks)
+        self.create_relations = create_relations
+        self.write_lock = RLock()
+        self.pool = None
+        if readonly and uri == ':memory:':
+            raise ValueError('in-memory graphs cannot be read-only')
+        self.db = self.open(
+            check_same_thread=check_same_thread and not pool_size)
+        if layout not in SQL.LAYOUTS:
+            raise ValueError('unknown layout: %r' % (layout,))
+        if readonly and profile is None:
+            profile = 'readonly'
+        if profile == 'readonly' and not readonly:
+            raise ValueError('the readonly profile needs readonly=True')
+        self.pragmas = PRAGMA.profile(profile)
+        if mmap is not None:
+            self.pragmas += (('mmap_size', int(mmap)),)
+        PRAGMA.apply(self.db, self.pragmas)
+        if pool_size:
+            if uri == ':memory:':
+                raise ValueError('in-memory graphs cannot be pooled')
+            if not readonly:
+                self.db.execute('PRAGMA journal_mode = WAL')
+            self.pool = ConnectionPool(self.open_reader, pool_size)
+        if readonly:
+            with closing(self.db.cursor()) as cursor:
+                self.registry.load(cursor)
+            self.check_interning()
+        else:
+            self.setup_sql(self.graphs)
+
+    def open(self, **kwargs):
+        """
+        Opens a new SQLite connection to the database
+        of the graph.
+
+        :param kwargs: Extra arguments to the connection.
+        """
+        if self.readonly:
+            kwargs['uri'] = True
+            return Connection(database=snapshot_uri(self.uri), **kwargs)
+        return Connection(database=self.uri, **kwargs)
+
+    @property
+    def reader_uri(self):
+        """
+        An SQLite URI which opens the database of the
+        graph read-only, e.g. in other processes, and as
+        an immutable file if the graph is read-only.
+        """
+        return readonly_uri(self.uri, immutable=self.readonly)
+
+    def open_reader(self):
+        """
+        Opens a new read-only SQLite connection for the
+        connection pool, which may be used from any
+        thread.
+        """
+        db = self.open(check_same_thread=False)
+        PRAGMA.apply(db, self.pragmas)
+        db.execute('PRAGMA query_only = 1')
+        return db
+
+    @contextmanager
+    def reader(self):
+        """
+        A context manager which returns a connection to
+        run queries on, checked out from the connection
+        pool if there is one.
+        """
+        if self.pool is None:
+            yield self.db
+            return
+        with self.pool.connection() as db:
+            yield db
 
     def setup_sql(self, graphs):
         """
         Sets up the SQL tables for the graph object,
-        and creates indexes as well.
+        and creates indexes as well. The relation registry
+        of the database is read first, and relations which
+        are registered as set up with the same edge
+        properties and degree tables are skipped. Databases
+        created with the old, shared ``src_index``/
+        ``dst_index`` layout are repaired by dropping those
+        indexes in favour of per-relation composite ones.
 
         :param graphs: The graphs to create.
         """
-        with closing(self.db.cursor()) as cursor:
+        with self.write_lock, closing(self.db.cursor()) as cursor:
+            for index in SQL.LEGACY_INDEXES:
+                cursor.execute('DROP INDEX IF EXISTS %s' % index)
+            if not self.registry.load(cursor):
+                cursor.execute(SQL.CREATE_RELATIONS)
+            self.check_interning()
+            if self.interner is not None:
+                cursor.execute(SQL.CREATE_NODES)
             for table in graphs:
-                cursor.execute(SQL.CREATE_TABLE % (table))
-                for index in SQL.INDEXES:
-                    cursor.execute(index % (table))
+                if not self.registry.current(table):
+                    self.registry.setup(cursor, SQL.relation(table))
             self.db.commit()
 
+    def check_interning(self):
+        """
+        Raises a ``ValueError`` if the relations of the
+        database were stored with interned nodes and the
+        graph does not intern nodes, or the other way
+        around, as the node ids and keys would be mixed
+        up. The node dictionary table is only created
+        when nodes are interned.
+        """
+        tables = self.registry.layouts
+        interned = 'graphlite_nodes' in tables
+        stored = any(not name.startswith(('graphlite_', 'sqlite_'))
+                     for name in tables)
+        if stored and interned != (self.interner is not None):
+            raise ValueError('the database was set up with '
+                             'intern_nodes=%r' % (interned,))
+
+    @property
+    def relations(self):
+        """
+        The sorted names of the relations registered in
+        the database, including ones not given when the
+        graph was opened.
+        """
+        return sorted(self.registry.relations)
+
+    def bulk_load(self, edges):
+        """
+        Stores a large number of *edges* in a single
+        transaction, optimised for ingesting snapshots.
+        Indexes on the graph's relations are dropped
+        during the load and rebuilt at the end, and
+        durability is relaxed for the duration, so a
+        crash mid-load may corrupt the database.
+
+        :param edges: An iterable of edges to store.
+        """
+        if self.readonly:
+            raise ReadOnlyError('cannot load into a read-only graph')
+        with self.write_lock:
+            self._bulk_load(edges)
+
+    def _bulk_load(self, edges):
+        self.db.commit()
+        with closing(self.db.cursor()) as cursor:
+            indexes = []
+            for table in self.graphs:
+                cursor.execute(SQL.LIST_INDEXES, (table,))
+                indexes.extend(cursor.fetchall())
+
+            previous = PRAGMA.apply(self.db, PRAGMA.profile('bulk'))
+            try:
+                for name, __ in indexes:
+                    cursor.execute('DROP INDEX %s' % name)
+                # the degrees are counted again once the edges are in
+                if self.degrees:
+                    for table in self.graphs:
+                        for smt in SQL.DROP_DEGREE_TRIGGERS:
+                            cursor.execute(smt % {'table': table})
+                        cursor.execute('DELETE FROM %s_degree' % table)
+                    self.db.commit()
+                with self.transaction() as tr:
+                    tr.store_many(edges)
+            finally:
+                for __, sql in indexes:
+                    cursor.execute(sql.replace(
+                        'CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1))
+                if self.degrees:
+                    for table in self.graphs:
+                        self.registry.setup_degrees(cursor, table)
+                self.db.commit()
+                PRAGMA.apply(self.db, previous)
+
     def close(self):
         """
-        Close the SQLite connection.
+        Close the SQLite connection, and the idle
+        connections of the pool.
         """
+        if self.pool is not None:
+            self.pool.close()
         self.db.close()
 
-    __del__ = close
+    def __del__(self):
+        if 'db' in self.__dict__:
+            self.close()
+
+    def marked(self, edge):
+        """
+        Returns the *edge* with its nodes wrapped in
+        :class:`graphlite.interning.Node` markers if nodes
+        are interned, so that they are replaced by their
+        ids when a query runs.
+
+        :param edge: The edge query.
+        """
+        if self.interner is None:
+            return edge
+        return edge._replace(src=self.marked_node(edge.src),
+                             dst=self.marked_node(edge.dst))
+
+    def marked_node(self, node):
+        """
+        Returns the *node* wrapped in a marker if nodes
+        are interned, see :meth:`marked`.
+
+        :param node: The node key.
+        """
+        if self.interner is None or node is None:
+            return node
+        return Node(node)
+
+    def bind(self, db, params):
+        """
+        Returns the *params* of a query with the marked
+        nodes replaced by their ids.
+
+        :param db: The SQLite connection to look ids up on.
+        :param params: The parameters.
+        """
+        if self.interner is None:
+            return params
+        return self.interner.bind(db, params)
+
+    def decode(self, db, ids):
+        """
+        Returns a list of the keys of the node *ids*
+        selected by a query, or the *ids* themselves if
+        nodes are not interned.
+
+        :param db: The SQLite connection to look keys up on.
+        :param ids: A list of node ids.
+        """
+        if self.interner is None:
+            return ids
+        return self.interner.decode(db, ids)
 
     def __contains__(self, edge):
         """
@@ -47,20 +351,236 @@ class Graph(object):
 
         :param edge: The edge to query.
         """
-        with closing(self.db.cursor()) as cursor:
-            cursor.execute(*SQL.select_one(edge.src, edge.rel, edge.dst))
-            return bool(cursor.fetchall())
+        edge = self.marked(edge)
+        smt, params = SQL.select_one(edge.src, edge.rel, edge.dst,
+                                     edge._filters)
+        with self.reader() as db, closing(db.cursor()) as cursor:
+            params = self.bind(db, params)
+            return self.hooks.fetchone(cursor, smt, params) is not None
 
     def find(self, edge_query):
         """
         Returns a Query object that acts on the graph.
         """
-        return Query(self.db)(edge_query)
+        return Query(self)(edge_query)
+
+    def _adjacent(self, rel, nodes, inverse=False, chunk=500, filters=()):
+        """
+        Yields ``(node, neighbour)`` pairs for the given
+        distinct *nodes*, querying *chunk* nodes at a
+        time, along the edges matching the property
+        *filters*. Every node is yielded as it was given.
+        """
+        nodes = list(nodes)
+        values = tuple(f[2] for f in filters)
+        with self.reader() as db, closing(db.cursor()) as cursor:
+            for i in range(0, len(nodes), chunk):
+                batch = nodes[i:i + chunk]
+                ids = batch
+                if self.interner is not None:
+                    ids = self.interner.encode(db, batch)
+                smt = SQL.adjacent(rel, len(batch), inverse, filters)
+                params = tuple(ids) + values
+                for rows in self.hooks.fetch(cursor, smt, params,
+                                             self.arraysize):
+                    neighbours = self.decode(db, [row[1] for row in rows])
+                    for row, neighbour in zip(rows, neighbours):
+                        yield batch[row[0]], neighbour
+
+    def neighbors_many(self, nodes, rel, inverse=False):
+        """
+        Returns a dictionary mapping each of the *nodes*
+        to a list of its neighbours along the relation,
+        i.e. the destination nodes of every node, or the
+        source nodes if *inverse*. Only one query is run
+        for every few hundred nodes.
+
+        :param nodes: An iterable of nodes.
+        :param rel: The relation.
+        :param inverse: Whether the nodes are destination
+            nodes and their source nodes are selected.
+        """
+        neighbors = dict((node, []) for node in nodes)
+        for node, neighbor in self._adjacent(rel, neighbors, inverse):
+            neighbors[node].append(neighbor)
+        return neighbors
+
+    def degree(self, node, rel, direction=SQL.OUT):
+        """
+        Returns the number of edges of the relation *rel*
+        that the *node* is the source of, the destination
+        of, or either. This is a single lookup if the
+        graph keeps degree tables, otherwise the edges
+        are counted.
+
+        :param node: The node.
+        :param rel: The relation.
+        :param direction: ``'out'``, ``'in'`` or ``'both'``.
+        """
+        smt, count = SQL.degree(rel, direction, self.degrees)
+        with self.reader() as db, closing(db.cursor()) as cursor:
+            params = self.bind(db, (self.marked_node(node),) * count)
+            row = self.hooks.fetchone(cursor, smt, params)
+            return 0 if row is None else row[0]
+
+    def top_degrees(self, rel, count=10, direction=SQL.OUT):
+        """
+        Returns a list of the *count* nodes with the most
+        edges of the relation *rel* in the *direction*,
+        as ``(node, degree)`` tuples with the highest
+        degree first. Ties are in no particular order.
+        Without degree tables every edge of the relation
+        is read.
+
+        :param rel: The relation.
+        :param count: The number of nodes.
+        :param direction: ``'out'``, ``'in'`` or ``'both'``.
+        """
+        smt = SQL.top_degrees(rel, direction, self.degrees)
+        nodes = []
+        with self.reader() as db, closing(db.cursor()) as cursor:
+            for rows in self.hooks.fetch(cursor, smt, (count,),
+                                         self.arraysize):
+                keys = self.decode(db, [row[0] for row in rows])
+                nodes.extend(zip(keys, (row[1] for row in rows)))
+        return nodes
 
-    def transaction(self):
+    def shortest_path(self, src, dst, rel):
+        """
+        Returns the shortest path from the *src* node to
+        the *dst* node as a list of nodes, following the
+        edges of the relation *rel*, or ``None`` if no
+        path exists. Uses a bidirectional breadth-first
+        search which issues one query per level.
+
+        :param src: The source node.
+        :param dst: The destination node.
+        :param rel: The relation.
+        """
+        if src == dst:
+            return [src]
+
+        # node -> (parent, distance) for each direction
+        seen = ({src: (None, 0)}, {dst: (None, 0)})
+        frontiers = ([src], [dst])
+
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            visited, other = seen[side], seen[1 - side]
+            frontier = []
+            meet = None
+
+            for node, neighbour in self._adjacent(rel, frontiers[side],
+                                                  inverse=bool(side)):
+                if neighbour in visited:
+                    continue
+                visited[neighbour] = (node, visited[node][1] + 1)
+                frontier.append(neighbour)
+                if neighbour in other:
+                    length = visited[neighbour][1] + other[neighbour][1]
+                    if meet is None or length < meet[1]:
+                        meet = (neighbour, length)
+
+            if meet is not None:
+                return _join_path(seen, meet[0])
+            frontiers = (
+                (frontier, frontiers[1]) if side == 0 else
+                (frontiers[0], frontier)
+            )
+        return None
+
+    def transaction(self, profile=None, flush_every=None, checkpoint=False,
+                    progress=None):
         """
         Returns a Transaction object. All modifying
         operations, i.e. ``store``, ``delete`` must
         then be performed on the transaction object.
+
+        :param profile: The name of a performance profile
+            to switch to while the transaction commits.
+            Its ``journal_mode`` and ``page_size`` are
+            left out, as they outlive the transaction.
+        :param flush_every: If given, a
+            :class:`graphlite.transaction.StreamingTransaction`
+            is returned which writes the edges in batches
+            of *flush_every* as they are passed in.
+        :param checkpoint: Whether a streaming transaction
+            commits every batch.
+        :param progress: A function called with the number
+            of edges written by a streaming transaction
+            after every batch.
         """
-        return Transaction(self.db)
+        if self.readonly:
+            raise ReadOnlyError('cannot modify a read-only graph')
+        if profile == 'readonly':
+            raise ValueError('transactions cannot use the readonly profile')
+        kwargs = dict(
+            layout=self.layout,
+            layouts=self.registry.layouts,
+            lock=self.write_lock,
+            pragmas=PRAGMA.transient(PRAGMA.profile(profile)),
+            cache=self.adjacency,
+            hooks=self.hooks,
+            interner=self.interner,
+            registry=self.registry if self.create_relations else None,
+        )
+        if flush_every is None:
+            return Transaction(self.db, **kwargs)
+        return StreamingTransaction(
+            self.db,
+            size=flush_every,
+            checkpoint=checkpoint,
+            progress=progress,
+            **kwargs
+        )
+
+
+def readonly_uri(uri, immutable=False):
+    """
+    Returns an SQLite URI which opens the database at
+    *uri*, either a path or a ``file:`` URI, read-only.
+    The query parameters of a URI are kept, apart from
+    its ``mode``.
+
+    :param uri: The path or URI of the database.
+    :param immutable: Whether the file is immutable.
+    """
+    params = []
+    path = uri
+    if uri.startswith('file:'):
+        path, __, query = uri[len('file:'):].partition('?')
+        if path.startswith('//'):
+            # skip the authority, e.g. file://localhost/path
+            path = '/' + path[2:].partition('/')[2]
+        path = unquote(path)
+        params = [param for param in query.split('&')
+                  if param.partition('=')[0] not in ('', 'mode', 'immutable')]
+    params.append('mode=ro')
+    if immutable:
+        params.append('immutable=1')
+    return 'file:%s?%s' % (quote(os.path.abspath(path)), '&'.join(params))
+
+
+def snapshot_uri(path):
+    """
+    Returns an SQLite URI which opens the database at
+    *path* as a read-only, immutable file.
+
+    :param path: The path or URI of the database.
+    """
+    return readonly_uri(path, immutable=True)
+
+
+def _join_path(seen, middle):
+    forwards, backwards = seen
+    path = []
+    node = middle
+    while node is not None:
+        path.append(node)
+        node = forwards[node][0]
+    path.reverse()
+    node = backwards[middle][0]
+    while node is not None:
+        path.append(node)
+        node = backwards[node][0]
+    return path
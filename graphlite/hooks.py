@@ -0,0 +1,162 @@
+"""
+    graphlite.hooks
+    ~~~~~~~~~~~~~~~
+    Instrumentation of the SQL statements executed by
+    a graph, for timing queries and logging slow ones.
+"""
+
+import logging
+from collections import namedtuple
+from contextlib import closing
+from timeit import default_timer as timer
+
+
+#: Describes an executed statement: the SQL, which never
+#: contains parameter values, the number of parameters
+#: (or of parameter sets for ``executemany``), the number
+#: of rows returned or modified and the wall time spent
+#: in SQLite in seconds.
+Execution = namedtuple('Execution', ('sql', 'params', 'rows', 'seconds'))
+
+
+class Hooks(object):
+    """
+    A list of callbacks which are invoked with an
+    :data:`Execution` after every statement that runs
+    through one of the ``execute`` methods.
+    """
+
+    def __init__(self):
+        self.callbacks = []
+
+    def add(self, callback):
+        """
+        Registers the *callback* and returns it, so that
+        this can be used as a decorator.
+
+        :param callback: A callable taking an
+            :data:`Execution`.
+        """
+        self.callbacks.append(callback)
+        return callback
+
+    def remove(self, callback):
+        """
+        Unregisters a previously added *callback*.
+
+        :param callback: The callback.
+        """
+        self.callbacks.remove(callback)
+
+    def __len__(self):
+        return len(self.callbacks)
+
+    def report(self, sql, params, rows, seconds):
+        if not self.callbacks:
+            return
+        execution = Execution(sql, params, rows, seconds)
+        for callback in list(self.callbacks):
+            callback(execution)
+
+    def fetch(self, cursor, sql, params, size):
+        """
+        Executes the query and yields lists of at most
+        *size* rows. The time spent consuming the rows
+        is not counted, and the execution is reported
+        once the rows run out or the generator is closed.
+
+        :param cursor: The SQLite cursor.
+        :param sql: The SQL query.
+        :param params: The parameters of the query.
+        :param size: The number of rows per list.
+        """
+        rows = 0
+        elapsed = 0.0
+        began = timer()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                batch = cursor.fetchmany(size)
+                elapsed += timer() - began
+                if not batch:
+                    break
+                rows += len(batch)
+                yield batch
+                began = timer()
+        finally:
+            self.report(sql, len(params), rows, elapsed)
+
+    def fetchall(self, cursor, sql, params=()):
+        """
+        Executes the query and returns a list of all of
+        its rows.
+        """
+        rows = []
+        for batch in self.fetch(cursor, sql, params, 256):
+            rows.extend(batch)
+        return rows
+
+    def fetchone(self, cursor, sql, params):
+        """
+        Executes the query and returns its first row,
+        or ``None`` if there are no rows.
+        """
+        with closing(self.fetch(cursor, sql, params, 1)) as batches:
+            for batch in batches:
+                return batch[0]
+        return None
+
+    def execute(self, cursor, sql, params=()):
+        """
+        Executes a statement which returns no rows.
+        """
+        began = timer()
+        try:
+            cursor.execute(sql, params)
+        finally:
+            self.report(sql, len(params), cursor.rowcount, timer() - began)
+
+    def executemany(self, cursor, sql, params):
+        """
+        Executes the statement once for every one of the
+        lazily generated *params*.
+        """
+        count = [0]
+
+        def counted():
+            for item in params:
+                count[0] += 1
+                yield item
+
+        began = timer()
+        try:
+            cursor.executemany(sql, counted())
+        finally:
+            self.report(sql, count[0], cursor.rowcount, timer() - began)
+
+
+class SlowQueryLog(object):
+    """
+    A hook which logs a warning for every statement that
+    takes at least *threshold* seconds, including its
+    SQL and the number of rows.
+
+    :param threshold: The threshold in seconds.
+    :param logger: The logger, which defaults to the
+        ``graphlite.slow`` logger.
+    """
+
+    def __init__(self, threshold=0.1, logger=None):
+        self.threshold = threshold
+        self.logger = logger or logging.getLogger('graphlite.slow')
+
+    def __call__(self, execution):
+        if execution.seconds < self.threshold:
+            return
+        self.logger.warning(
+            'slow query (%.3fs, %d params, %d rows):\n%s',
+            execution.seconds,
+            execution.params,
+            execution.rows,
+            execution.sql,
+        )
@@ -0,0 +1,183 @@
+"""
+    graphlite.interning
+    ~~~~~~~~~~~~~~~~~~~
+    Maps external node keys, such as UUID strings, to
+    compact integer ids which are stored in the edges
+    instead, through a dictionary table.
+"""
+
+from contextlib import closing
+
+from graphlite.cache import LRUCache
+from graphlite.hooks import Hooks
+import graphlite.sql as SQL
+
+
+#: The id given to keys which are not in the node
+#: dictionary. It is never assigned, so queries on an
+#: unknown node select nothing.
+UNKNOWN = -1
+
+
+class Node(object):
+    """
+    Marks a node key in the parameters of a query, to
+    be replaced by its id when the query runs.
+
+    :param key: The node key.
+    """
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return 'Node(%r)' % (self.key,)
+
+
+class Interner(object):
+    """
+    Translates node keys to ids and back, in bulk, with
+    the most recently used translations cached in both
+    directions.
+
+    :param maxsize: The number of translations to cache
+        in each direction.
+    :param chunk: The number of keys or ids looked up
+        per query.
+    :param hooks: The :class:`graphlite.hooks.Hooks` to
+        report the executed statements to.
+    """
+
+    def __init__(self, maxsize=65536, chunk=500, hooks=None):
+        self.ids = LRUCache(maxsize)
+        self.keys = LRUCache(maxsize)
+        self.chunk = chunk
+        self.hooks = Hooks() if hooks is None else hooks
+
+    def remember(self, key, id):
+        self.ids.put(key, id)
+        self.keys.put(id, key)
+
+    def _lookup(self, cursor, smt, values):
+        for i in range(0, len(values), self.chunk):
+            batch = values[i:i + self.chunk]
+            for row in self.hooks.fetchall(cursor, smt(len(batch)), batch):
+                yield row
+
+    def encode(self, db, keys, create=False):
+        """
+        Returns a list with the id of each of the *keys*,
+        or :data:`UNKNOWN` for keys that have no id.
+        ``None`` is kept as it is.
+
+        :param db: The SQLite connection.
+        :param keys: A list of node keys.
+        :param create: Whether to assign ids to unknown
+            keys, inside the current transaction.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            if key is None or key in found:
+                continue
+            id = self.ids.get(key)
+            if id is None:
+                missing.append(key)
+                id = UNKNOWN
+            found[key] = id
+
+        if missing:
+            with closing(db.cursor()) as cursor:
+                if create:
+                    self.hooks.executemany(cursor, SQL.INSERT_NODE,
+                                           ((key,) for key in missing))
+                for key, id in self._lookup(cursor, SQL.select_ids, missing):
+                    found[key] = id
+                    self.remember(key, id)
+        return [None if key is None else found[key] for key in keys]
+
+    def decode(self, db, ids):
+        """
+        Returns a list with the key of each of the *ids*.
+
+        :param db: The SQLite connection.
+        :param ids: A list of node ids.
+        """
+        found = {}
+        missing = []
+        for id in ids:
+            if id in found:
+                continue
+            key = self.keys.get(id)
+            if key is None:
+                missing.append(id)
+            found[id] = key
+
+        if missing:
+            with closing(db.cursor()) as cursor:
+                for id, key in self._lookup(cursor, SQL.select_keys, missing):
+                    found[id] = key
+                    self.remember(key, id)
+        return [found[id] for id in ids]
+
+    def bind(self, db, params):
+        """
+        Returns the *params* of a query with every
+        :class:`Node` replaced by the id of its key.
+
+        :param db: The SQLite connection.
+        :param params: The parameters.
+        """
+        keys = [param.key for param in params if isinstance(param, Node)]
+        if not keys:
+            return params
+        ids = iter(self.encode(db, keys))
+        return tuple(
+            next(ids) if isinstance(param, Node) else param
+            for param in params
+        )
+
+    def encode_edges(self, db, edges, create=False):
+        """
+        Returns a list of the *edges* with their source
+        and destination keys replaced by ids.
+
+        :param db: The SQLite connection.
+        :param edges: A list of edges.
+        :param create: Whether to assign ids to unknown
+            keys.
+        """
+        keys = []
+        for edge in edges:
+            keys.append(edge.src)
+            keys.append(edge.dst)
+        ids = self.encode(db, keys, create)
+        return [
+            edge._replace(src=ids[2 * i], dst=ids[2 * i + 1])
+            for i, edge in enumerate(edges)
+        ]
+
+    def clear(self):
+        """
+        Forgets every cached translation, e.g. after ids
+        were assigned in a transaction that was rolled
+        back.
+        """
+        self.ids.clear()
+        self.keys.clear()
+
+    def stats(self):
+        """
+        Returns the cache statistics of both directions.
+        """
+        return {'ids': self.ids.stats(), 'keys': self.keys.stats()}
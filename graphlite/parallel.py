@@ -0,0 +1,92 @@
+"""
+    graphlite.parallel
+    ~~~~~~~~~~~~~~~~~~
+    Runs the last hop of a traversal on a pool of
+    processes, each with its own read-only connection
+    to the database file.
+"""
+
+from contextlib import closing
+from multiprocessing import Pool, cpu_count
+from sqlite3 import Connection
+
+import graphlite.sql as SQL
+
+
+def partition(nodes, count):
+    """
+    Splits the sorted list of *nodes* into at most
+    *count* contiguous ranges of similar size.
+
+    :param nodes: A sorted list of nodes.
+    :param count: The number of partitions.
+    """
+    size = -(-len(nodes) // max(count, 1))
+    return [nodes[i:i + size] for i in range(0, len(nodes), size)]
+
+
+def expand(task, chunk=500):
+    """
+    Runs a traversal hop for a partition of the
+    frontier and returns the set of selected nodes.
+    This is ran inside the worker processes.
+
+    :param task: A ``(uri, rel, dst, filters, nodes)``
+        tuple, where *uri* opens the database read-only.
+    :param chunk: The number of nodes per query.
+    """
+    uri, rel, dst, filters, nodes = task
+    found = set()
+    with closing(Connection(uri, uri=True)) as db:
+        for i in range(0, len(nodes), chunk):
+            batch = nodes[i:i + chunk]
+            smt, params = SQL.partition_hop(rel, batch, dst, filters)
+            found.update(row[0] for row in db.execute(smt, params))
+    return found
+
+
+def run(query, processes=None, pool=None):
+    """
+    Runs the *query*, which must end with a traversal
+    hop, by selecting the distinct nodes of the frontier
+    of that hop locally, partitioning them by node range
+    and running the hop for every partition in parallel.
+    Returns the set of selected nodes.
+
+    :param query: The query.
+    :param processes: The number of processes, which
+        defaults to the number of CPUs.
+    :param pool: A ``multiprocessing.Pool`` to use
+        instead of starting a new one.
+    """
+    if query.hop is None:
+        raise ValueError('query does not end with a traversal')
+    graph = query.graph
+    if graph.uri == ':memory:':
+        raise ValueError('in-memory graphs cannot be queried in parallel')
+
+    frontier, edge = query.hop
+    nodes = set()
+    for batch in frontier.batches(decode=False):
+        nodes.update(batch)
+    nodes = sorted(nodes)
+    with graph.reader() as db:
+        dst, = graph.bind(db, (edge.dst,))
+    processes = processes or cpu_count()
+    tasks = [
+        (graph.reader_uri, edge.rel, dst, edge._filters, part)
+        for part in partition(nodes, processes)
+    ]
+    if not tasks:
+        return set()
+
+    if pool is not None:
+        results = pool.map(expand, tasks)
+    else:
+        with closing(Pool(min(processes, len(tasks)))) as pool:
+            results = pool.map(expand, tasks)
+    found = set().union(*results)
+    if graph.interner is None:
+        return found
+    with graph.reader() as db:
+        return set(graph.decode(db, list(found)))
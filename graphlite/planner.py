@@ -0,0 +1,85 @@
+"""
+    graphlite.planner
+    ~~~~~~~~~~~~~~~~~
+    Compiles chains of intersections and differences
+    of edge queries into semi-joins, which scan the
+    smallest operand and probe the others by index.
+"""
+
+import graphlite.sql as SQL
+
+
+INTERSECT = 'INTERSECT'
+EXCEPT = 'EXCEPT'
+
+
+def operand(edge):
+    """
+    Returns the relation of an edge query, whether it
+    selects source nodes and the node it is given.
+
+    :param edge: The edge query.
+    """
+    if edge.dst is None:
+        return edge.rel, False, edge.src
+    return edge.rel, True, edge.dst
+
+
+def plan(terms, name='stats1'):
+    """
+    Compiles a chain of edge queries combined with
+    ``INTERSECT`` and ``EXCEPT``, which is evaluated left
+    to right, and returns a ``(sql, params, ctes)``
+    tuple for a :class:`graphlite.query.Query`.
+
+    Since the chain selects the nodes which are in the
+    first operand and every intersected one and in none
+    of the excluded ones, any of the intersected operands
+    can be scanned while the others are probed. Which one
+    is decided when the query runs- every intersected
+    operand is counted up to :data:`graphlite.sql.SIZE_LIMIT`
+    nodes in the *name* stage and there is a semi-join
+    per operand, of which only the one scanning the
+    smallest operand is ran. An empty operand is then
+    scanned, so nothing else is.
+
+    :param terms: A list of ``(operator, edge)`` tuples,
+        with an operator of ``None`` for the first one.
+    :param name: The name of the stage holding the sizes.
+    """
+    included = [operand(edge) for op, edge in terms if op != EXCEPT]
+    excluded = [operand(edge) for op, edge in terms if op == EXCEPT]
+
+    def semi_join(i, stage=None, condition=None):
+        rel, inverse, node = included[i]
+        # (rel, inverse, node, negate) of every other operand
+        probes = [
+            other + (False,) for j, other in enumerate(included) if j != i
+        ] + [other + (True,) for other in excluded]
+        smt = SQL.semi_join(
+            rel, inverse,
+            [(r, inv, negate) for r, inv, __, negate in probes],
+            stage=stage,
+            condition=condition,
+        )
+        return smt, (node,) + tuple(probe[2] for probe in probes)
+
+    if len(included) == 1:
+        smt, params = semi_join(0)
+        return (smt,), params, ()
+
+    sql = []
+    params = tuple(node for __, __, node in included)
+    for i in range(len(included)):
+        # exactly one semi-join runs: ties go to the first operand
+        condition = ' AND '.join(
+            'n%d %s n%d' % (i, '<' if j < i else '<=', j)
+            for j in range(len(included)) if j != i
+        )
+        smt, args = semi_join(i, stage=name, condition=condition)
+        if sql:
+            sql.append('UNION ALL')
+        sql.append(smt)
+        params += args
+    sizes = [SQL.operand_size(rel, inverse) for rel, inverse, __ in included]
+    return tuple(sql), params, (SQL.sizes_stage(name, sizes),)
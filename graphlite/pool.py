@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+from threading import Lock
+
+try:
+    from queue import Empty, LifoQueue
+except ImportError:  # pragma: no cover
+    from Queue import Empty, LifoQueue
+
+
+class ConnectionPool(object):
+    """
+    A bounded pool of SQLite connections which are
+    created lazily by calling *connect*. Threads check
+    out a connection for the duration of a query and
+    wait for one to be returned if all of them are in
+    use.
+
+    :param connect: A callable returning a connection.
+    :param size: The maximum number of connections.
+    """
+
+    def __init__(self, connect, size):
+        self.connect = connect
+        self.size = size
+        self.idle = LifoQueue()
+        self.lock = Lock()
+        self.created = 0
+        self.checkouts = 0
+        self.waits = 0
+
+    def acquire(self, timeout=None):
+        """
+        Checks out a connection, creating a new one if
+        there are no idle connections and the pool is
+        not full, otherwise waits for one.
+
+        :param timeout: The number of seconds to wait
+            before raising ``queue.Empty``.
+        """
+        with self.lock:
+            self.checkouts += 1
+            try:
+                return self.idle.get_nowait()
+            except Empty:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+                else:
+                    self.waits += 1
+        if not create:
+            return self.idle.get(timeout=timeout)
+        try:
+            return self.connect()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def release(self, db):
+        """
+        Returns a checked out connection to the pool.
+
+        :param db: The connection.
+        """
+        self.idle.put(db)
+
+    @contextmanager
+    def connection(self):
+        """
+        A context manager which checks out a connection
+        and returns it to the pool on exit.
+        """
+        db = self.acquire()
+        try:
+            yield db
+        finally:
+            self.release(db)
+
+    def close(self):
+        """
+        Closes every idle connection in the pool.
+        """
+        while True:
+            try:
+                db = self.idle.get_nowait()
+            except Empty:
+                break
+            db.close()
+            with self.lock:
+                self.created -= 1
+
+    def stats(self):
+        """
+        Returns a dictionary with the size of the pool,
+        the number of open and idle connections and the
+        number of checkouts, as well as the number of
+        checkouts that had to wait for a connection.
+        """
+        with self.lock:
+            return {
+                'size': self.size,
+                'open': self.created,
+                'idle': self.idle.qsize(),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+            }
@@ -0,0 +1,92 @@
+from contextlib import closing
+
+
+#: Named sets of SQLite pragmas, applied in order.
+#: ``page_size`` only has an effect on new databases.
+PROFILES = {
+    'durable': (
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'FULL'),
+        ('cache_size', -16384),
+        ('temp_store', 'DEFAULT'),
+        ('mmap_size', 0),
+    ),
+    'fast': (
+        ('page_size', 8192),
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -65536),
+        ('temp_store', 'MEMORY'),
+        ('mmap_size', 268435456),
+    ),
+    'bulk': (
+        ('page_size', 8192),
+        ('journal_mode', 'MEMORY'),
+        ('synchronous', 'OFF'),
+        ('cache_size', -262144),
+        ('temp_store', 'MEMORY'),
+        ('mmap_size', 268435456),
+    ),
+    'readonly': (
+        ('query_only', 1),
+        ('cache_size', -65536),
+        ('temp_store', 'MEMORY'),
+        ('mmap_size', 1073741824),
+    ),
+}
+
+
+#: Pragmas which change the database file rather than
+#: the connection, and so are never switched for the
+#: duration of a transaction.
+PERSISTENT = frozenset(['journal_mode', 'page_size'])
+
+
+def profile(name):
+    """
+    Returns the pragmas of the profile with the given
+    *name*, or no pragmas if the name is ``None``.
+
+    :param name: The name of the profile.
+    """
+    if name is None:
+        return ()
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError('unknown profile: %r' % (name,))
+
+
+def transient(pragmas):
+    """
+    Returns the *pragmas* without those in
+    :data:`PERSISTENT`, so that they can be set for a
+    while and restored.
+
+    :param pragmas: An iterable of ``(name, value)``.
+    """
+    return tuple(pair for pair in pragmas if pair[0] not in PERSISTENT)
+
+
+def apply(db, pragmas):
+    """
+    Sets the *pragmas* on the connection and returns
+    their previous values, in the order they should be
+    restored in. A database is never switched out of
+    WAL mode since that needs exclusive access to it.
+
+    :param db: The SQLite connection.
+    :param pragmas: An iterable of ``(name, value)``.
+    """
+    previous = []
+    with closing(db.cursor()) as cursor:
+        for name, value in pragmas:
+            row = cursor.execute('PRAGMA %s' % name).fetchone()
+            if row is None:
+                continue
+            if name == 'journal_mode' and row[0] == 'wal':
+                continue
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+            previous.append((name, row[0]))
+    previous.reverse()
+    return previous
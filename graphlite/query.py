@@ -1,11 +1,55 @@
+import json
+from array import array
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from contextlib import closing
 from itertools import islice
 from collections import namedtuple
+import graphlite.parallel as parallel
+import graphlite.planner as planner
 import graphlite.sql as SQL
 
 
 _V = namedtuple('V', ('src', 'rel', 'dst'))
 
+#: A page of nodes returned by :meth:`Query.page`, along
+#: with the token to pass to fetch the next page, which
+#: is ``None`` on the last page.
+Page = namedtuple('Page', ('items', 'token'))
+
+#: A step of the plan returned by :meth:`Query.explain`.
+#: *parent* is the id of the enclosing step, or zero
+#: for top-level steps.
+PlanStep = namedtuple('PlanStep', ('id', 'parent', 'detail'))
+
+#: Traversal hops are compiled into a common table
+#: expression per hop which is deduplicated and joined
+#: against the relation.
+JOIN = 'join'
+
+#: Traversal hops are compiled into nested ``IN``
+#: subqueries.
+NESTED = 'nested'
+
+
+class _Refinement(object):
+    """
+    Exposes a method of :class:`V` which refines an edge
+    query once it has a relation. Before that the name
+    selects the relation of the same name, so no names
+    are taken away from relations.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.__doc__ = method.__doc__
+
+    def __get__(self, edge, cls):
+        if edge is None:
+            return self.method
+        if edge.rel is None:
+            return V(edge.src, self.method.__name__, edge.dst)
+        return self.method.__get__(edge, cls)
+
 
 class V(_V):
     """
@@ -14,29 +58,113 @@ class V(_V):
     parameter is named `edge`. All parameters are optional
     and default to None.
 
+    Edge property values, filters and orderings are kept
+    outside of the ``(src, rel, dst)`` tuple, in the
+    ``_values``, ``_filters`` and ``_ordering`` attributes.
+
     :param src: The source node.
     :param rel: The relation.
     :param dst: The destination node.
     """
 
+    _values = ()
+    _filters = ()
+    _ordering = ()
+
     def __new__(cls, src=None, rel=None, dst=None):
         return _V.__new__(cls, src, rel, dst)
 
     def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
         return V(self.src, attr, self.dst)
 
-    def __call__(self, dst):
+    def _refined(self, dst, values=(), filters=(), ordering=()):
+        edge = V(self.src, self.rel, dst)
+        if values:
+            edge._values = values
+        if filters:
+            edge._filters = filters
+        if ordering:
+            edge._ordering = ordering
+        return edge
+
+    def _replace(self, **kwargs):
+        edge = _V._replace(self, **kwargs)
+        edge.__dict__.update(self.__dict__)
+        return edge
+
+    def __call__(self, dst, **values):
         """
-        Assign a destination node to the edge.
+        Assign a destination node to the edge, along
+        with the values of its properties when it is
+        stored.
 
         :param dst: The destination node.
+        :param values: The property values.
+        """
+        values = tuple(
+            (SQL.identifier(name), value)
+            for name, value in sorted(values.items())
+        )
+        return self._refined(dst, values, self._filters, self._ordering)
+
+    @_Refinement
+    def where(self, **filters):
         """
-        return V(self.src, self.rel, dst)
+        Returns an edge query only matching the edges
+        whose properties pass the *filters*. Each filter
+        is a property name with an optional operator
+        suffix- one of ``__eq`` (the default), ``__ne``,
+        ``__lt``, ``__lte``, ``__gt`` or ``__gte``::
+
+            V(1).follows.where(created__gte=t0, created__lt=t1)
+
+        Until the edge has a relation, ``where`` selects
+        the relation named ``where``.
+
+        :param filters: The filters.
+        """
+        parsed = []
+        for key, value in sorted(filters.items()):
+            name, __, operator = key.partition('__')
+            operator = operator or 'eq'
+            if operator not in SQL.OPERATORS:
+                raise ValueError('unknown operator: %r' % (operator,))
+            parsed.append((SQL.identifier(name), operator, value))
+        return self._refined(self.dst, self._values,
+                             self._filters + tuple(parsed), self._ordering)
+
+    @_Refinement
+    def order_by(self, *names):
+        """
+        Returns an edge query selecting nodes in the
+        order of the edge properties with the given
+        *names*, descending if prefixed with ``-``.
+        Combined with slicing this selects the top
+        nodes, e.g. the ten heaviest edges of a node::
+
+            graph.find(V(1).knows.order_by('-weight'))[:10]
+
+        Ordered edge queries cannot be combined with
+        set operations, as SQLite only orders their
+        result by its single node column.
+
+        :param names: The property names.
+        """
+        ordering = tuple(
+            (SQL.identifier(name.lstrip('-')), name.startswith('-'))
+            for name in names
+        )
+        return self._refined(self.dst, self._values, self._filters,
+                             self._ordering + ordering)
 
     def __repr__(self):
-        return '(%s)-[%s]->(%s)' % (
+        return '(%s)-[%s%s]->(%s)' % (
             '*' if self.src is None else self.src,
             '*' if self.rel is None else ':%s' % self.rel,
+            ' {%s}' % ', '.join('%s: %r' % pair for pair in self._values)
+            if self._values else '',
             '*' if self.dst is None else self.dst,
         )
 
@@ -44,33 +172,78 @@ class V(_V):
         """
         Generate an SQL query for the edge object.
         """
-        return (
+        smt, params = (
             SQL.forwards_relation(self.src, self.rel) if self.dst is None else
             SQL.inverse_relation(self.dst, self.rel)
             )
+        return SQL.refine(smt, params, self._filters, self._ordering)
 
 
 class Query(object):
-    __slots__ = ('db', 'sql', 'params')
+    __slots__ = ('graph', 'sql', 'params', 'ctes', 'key', 'hop', 'terms',
+                 'ordered')
 
     """
     Create a new query object that acts on a particular
-    SQLite connection instance.
+    graph instance.
 
-    :param db: The SQLite connection.
+    :param graph: The graph.
+    :param sql: The SQL queries making up the statement.
+    :param params: The parameters of the statement.
+    :param ctes: The common table expressions that
+        the statement depends on, one per traversal hop.
+    :param key: The adjacency cache key of single-hop
+        queries, otherwise ``None``.
+    :param hop: A ``(frontier, edge)`` tuple if the query
+        ends with a traversal hop, otherwise ``None``.
+    :param terms: The ``(operator, edge)`` operands if
+        the query is a chain of edge queries combined
+        with intersections and differences, which is
+        compiled by :func:`graphlite.planner.plan`.
+    :param ordered: Whether the query ends with an
+        ordered edge query.
     """
-    def __init__(self, db, sql=(), params=()):
-        self.db = db
+    def __init__(self, graph, sql=(), params=(), ctes=(), key=None,
+                 hop=None, terms=None, ordered=False):
+        self.graph = graph
         self.sql = sql
         self.params = params
+        self.ctes = ctes
+        self.key = key
+        self.hop = hop
+        self.terms = terms
+        self.ordered = ordered
+
+    @property
+    def db(self):
+        """
+        The SQLite connection of the graph.
+        """
+        return self.graph.db
 
     @property
     def statement(self):
         """
         Joins all of the SQL queries together and then
         returns the result. It is the query to be ran.
+        The SQL queries never contain any of the
+        parameter values, so queries of the same shape
+        share a statement and its prepared form in the
+        statement cache of the connection.
         """
-        return '\n'.join(self.sql)
+        return '\n'.join(self.plan)
+
+    @property
+    def plan(self):
+        """
+        Returns the compiled stages of the query- a
+        ``WITH`` clause holding the common table
+        expression of every traversal hop, if any,
+        followed by the queries of the final stage.
+        """
+        if not self.ctes:
+            return self.sql
+        return ('WITH %s' % ',\n'.join(self.ctes),) + self.sql
 
     def __iter__(self):
         """
@@ -79,10 +252,48 @@ class Query(object):
         this function as many times as you want but it
         may not return the same values.
         """
-        with closing(self.db.cursor()) as cursor:
-            cursor.execute(self.statement, self.params)
-            for row in cursor:
-                yield row[0]
+        for batch in self.batches():
+            for node in batch:
+                yield node
+
+    def batches(self, size=None, decode=True):
+        """
+        Execute the query and yield the results in lists
+        of at most *size* nodes, fetched from SQLite one
+        batch at a time.
+
+        :param size: The batch size, which defaults to
+            the ``arraysize`` of the graph.
+        :param decode: Whether to translate the node ids
+            of a graph with interned nodes back to keys.
+        """
+        size = size or self.graph.arraysize
+        nodes = self.cached() if decode else None
+        if nodes is not None:
+            for i in range(0, len(nodes), size):
+                yield list(nodes[i:i + size])
+            return
+
+        graph = self.graph
+        with graph.reader() as db, closing(db.cursor()) as cursor:
+            params = graph.bind(db, self.params)
+            for rows in graph.hooks.fetch(cursor, self.statement, params,
+                                          size):
+                nodes = [row[0] for row in rows]
+                yield graph.decode(db, nodes) if decode else nodes
+
+    def explain(self):
+        """
+        Returns the plan SQLite chooses for the query,
+        from ``EXPLAIN QUERY PLAN``, as a list of
+        :data:`PlanStep` tuples. A ``SCAN`` of a relation
+        where a ``SEARCH`` is expected usually points to
+        a missing index.
+        """
+        smt = 'EXPLAIN QUERY PLAN %s' % self.statement
+        with self.graph.reader() as db, closing(db.cursor()) as cursor:
+            cursor.execute(smt, self.graph.bind(db, self.params))
+            return [PlanStep(row[0], row[1], row[-1]) for row in cursor]
 
     def derived(self, statement, params=(), replace=False):
         """
@@ -97,9 +308,10 @@ class Query(object):
             SQL query.
         """
         return Query(
-            db=self.db,
+            graph=self.graph,
             sql=(statement,) if replace else self.sql + (statement,),
-            params=self.params + params,
+            params=self.params + tuple(params),
+            ctes=self.ctes,
         )
 
     def __call__(self, edge):
@@ -111,10 +323,54 @@ class Query(object):
 
         :param edge: The edge query.
         """
+        if edge._ordering and self.sql:
+            raise ValueError('ordered edge queries cannot be combined')
+        plain = not (edge._filters or edge._ordering)
+        key = planner.operand(edge)
+        edge = self.graph.marked(edge)
+        if plain and self.terms and self.terms[-1][1] is None:
+            terms = self.terms[:-1] + ((self.terms[-1][0], edge),)
+            sql, params, ctes = planner.plan(terms)
+            return Query(self.graph, sql, params, ctes, terms=terms)
+
         smt, params = edge.gen_query()
-        return self.derived(smt, params)
+        query = self.derived(smt, params)
+        query.ordered = bool(edge._ordering)
+        if plain and not self.sql:
+            query.key = key
+            query.terms = ((None, edge),)
+        return query
+
+    def combined(self, operator):
+        """
+        Returns a new query object waiting for the edge
+        query to combine with the current one using the
+        SQL set *operator*. Intersections and differences
+        of edge queries are left to the planner.
+
+        :param operator: The SQL set operator.
+        """
+        if self.ordered:
+            raise ValueError('ordered edge queries cannot be combined')
+        query = self.derived(operator)
+        if self.terms and operator in (planner.INTERSECT, planner.EXCEPT):
+            query.terms = self.terms + ((operator, None),)
+        return query
+
+    def cached(self):
+        """
+        Returns the selected nodes as a tuple from the
+        adjacency cache of the graph, fetching them if
+        they are not cached, or ``None`` if the query is
+        not a single-hop query or there is no cache.
+        """
+        cache = self.graph.adjacency
+        if cache is None or self.key is None:
+            return None
+        plain = Query(self.graph, self.sql, self.params, self.ctes)
+        return cache.lookup(self.key, plain.__iter__)
 
-    def traverse(self, edge):
+    def traverse(self, edge, strategy=NESTED):
         """
         Traverse the graph, and selecting the destination
         nodes for a particular relation that the selected
@@ -124,22 +380,140 @@ class Query(object):
         :param edge: The edge query. If the edge's
             destination node is specified then the source
             nodes will be selected.
+        :param strategy: How the hop is compiled. With
+            ``NESTED``, the default, the currently selected
+            nodes are wrapped in an ``IN`` subquery, with
+            ``JOIN`` they become a stage of the ``WITH``
+            clause which is deduplicated and joined
+            against the relation.
         """
-        query = self.statement
+        query = '\n'.join(self.sql)
+        edge = self.graph.marked(edge)
         rel, dst = edge.rel, edge.dst
+        refinements = (edge._filters, edge._ordering)
+        if strategy == NESTED:
+            statement, params = (
+                SQL.compound_fwd_query(query, rel, *refinements)
+                if dst is None else
+                SQL.compound_inv_query(query, rel, dst, *refinements)
+            )
+            derived = self.derived(statement, params, replace=True)
+            derived.hop = (self, edge)
+            derived.ordered = bool(edge._ordering)
+            return derived
+
+        if strategy != JOIN:
+            raise ValueError('unknown strategy: %r' % (strategy,))
+        stage = 'hop%d' % (len(self.ctes) + 1)
         statement, params = (
-            SQL.compound_fwd_query(query, rel) if dst is None else
-            SQL.compound_inv_query(query, rel, dst)
+            SQL.join_fwd_query(stage, rel, *refinements) if dst is None else
+            SQL.join_inv_query(stage, rel, dst, *refinements)
+        )
+        return Query(
+            graph=self.graph,
+            sql=(statement,),
+            params=self.params + params,
+            ctes=self.ctes + (SQL.traversal_stage(stage, query),),
+            hop=(self, edge),
+            ordered=bool(edge._ordering),
+        )
+
+    def parallel(self, processes=None, pool=None):
+        """
+        Runs the query on a pool of processes and returns
+        the set of distinct selected nodes. The query has
+        to end with a :meth:`traverse` hop- the frontier
+        of the hop is selected first, then partitioned by
+        node range, and every process runs the hop for
+        one partition on its own read-only connection.
+        The graph must be stored in a file.
+
+        :param processes: The number of processes, which
+            defaults to the number of CPUs.
+        :param pool: A ``multiprocessing.Pool`` to reuse.
+        """
+        return parallel.run(self, processes=processes, pool=pool)
+
+    def traverse_until(self, edge, depth=None, inverse=False):
+        """
+        Selects the distinct nodes reachable from the
+        selected nodes in one or more hops along the
+        relation of the *edge*, i.e. select everyone in
+        my extended network. The traversal happens in a
+        single recursive query and cycles are handled.
+
+        :param edge: The edge query, only the relation
+            is used.
+        :param depth: The maximum number of hops, or
+            ``None`` for no limit.
+        :param inverse: Whether to walk the edges from
+            destination to source nodes instead.
+        """
+        if depth is not None and depth < 1:
+            raise ValueError('depth must be at least 1')
+        number = len(self.ctes) + 1
+        seed = 'hop%d' % number
+        name = 'reach%d' % number
+        stage, params = SQL.reachable_stage(
+            name, seed, edge.rel,
+            inverse=inverse,
+            depth=depth,
+            filters=edge._filters,
+        )
+        smt = 'SELECT %s id FROM %s' % (
+            '' if depth is None else 'DISTINCT', name)
+        return Query(
+            graph=self.graph,
+            sql=(smt,),
+            params=self.params + params,
+            ctes=self.ctes + (
+                SQL.traversal_stage(seed, '\n'.join(self.sql)),
+                stage,
+            ),
         )
-        return self.derived(statement, params, replace=True)
+
+    def depths(self, edge, depth=None, inverse=False):
+        """
+        Similar to :meth:`traverse_until` but returns a
+        dictionary mapping every reachable node to the
+        smallest number of hops needed to reach it. The
+        graph is walked breadth-first with one query per
+        level for every few hundred nodes, so every edge
+        is read at most twice however many cycles there
+        are.
+
+        :param edge: The edge query. Its relation and
+            property filters are used.
+        :param depth: The maximum number of hops.
+        :param inverse: Whether to walk the edges from
+            destination to source nodes instead.
+        """
+        if depth is not None and depth < 1:
+            raise ValueError('depth must be at least 1')
+        depths = {}
+        frontier = self.to(set)
+        level = 0
+        while frontier and (depth is None or level < depth):
+            level += 1
+            reached = set()
+            for __, node in self.graph._adjacent(edge.rel, frontier, inverse,
+                                                 filters=edge._filters):
+                if node not in depths:
+                    depths[node] = level
+                    reached.add(node)
+            frontier = reached
+        return depths
 
     @property
     def intersection(self):
         """
         Intersect the current query with another one
-        using an SQL INTERSECT.
+        using an SQL INTERSECT. Chains of intersections
+        and differences of edge queries are ran as a
+        semi-join which scans the smallest intersected
+        edge query and looks up its nodes in the others.
         """
-        return self.derived('INTERSECT')
+        return self.combined('INTERSECT')
 
     @property
     def difference(self):
@@ -150,7 +524,7 @@ class Query(object):
         implementation to
         :meth:`graphlite.query.Query.intersection`.
         """
-        return self.derived('EXCEPT')
+        return self.combined('EXCEPT')
 
     @property
     def union(self):
@@ -160,16 +534,62 @@ class Query(object):
         :meth:`graphlite.query.Query.intersection`
         method.
         """
-        return self.derived('UNION')
+        return self.combined('UNION')
+
+    def wrapped(self, template):
+        """
+        Returns a new query object that wraps the queries
+        of the current instance inside the *template*,
+        keeping the traversal stages and parameters.
+
+        :param template: An SQL template with a single
+            ``%s`` placeholder for the current queries.
+        """
+        return Query(
+            graph=self.graph,
+            sql=(template % '\n'.join(self.sql),),
+            params=self.params,
+            ctes=self.ctes,
+        )
+
+    def scalar(self):
+        """
+        Executes the query and returns the first column
+        of the first row, or ``None`` if there are no
+        rows.
+        """
+        graph = self.graph
+        with graph.reader() as db, closing(db.cursor()) as cursor:
+            params = graph.bind(db, self.params)
+            row = graph.hooks.fetchone(cursor, self.statement, params)
+            return None if row is None else row[0]
 
     def count(self):
         """
-        Counts the objects returned by the query.
-        You will not be able to iterate through this
-        query again (with deterministic results,
-        anyway).
+        Counts the objects returned by the query, using
+        an SQL ``COUNT`` so that no rows are transferred.
+        Duplicate nodes are counted for every time they
+        would be yielded.
         """
-        return sum(1 for __ in self)
+        return self.wrapped(SQL.COUNT_QUERY).scalar()
+
+    def exists(self):
+        """
+        Returns whether the query selects any nodes.
+        SQLite stops evaluating the query as soon as the
+        first node is found.
+        """
+        return self.wrapped(SQL.EXISTS_QUERY).scalar() is not None
+
+    def first(self):
+        """
+        Returns the first node selected by the query, or
+        ``None`` if there are no nodes.
+        """
+        for batch in self.derived(*SQL.limit(0, 1)).batches():
+            for node in batch:
+                return node
+        return None
 
     def __getitem__(self, obj):
         """
@@ -186,6 +606,58 @@ class Query(object):
             obj.step,
             )
 
+    def page(self, after=None, size=100):
+        """
+        Returns a :class:`Page` of at most *size* distinct
+        nodes selected by the query in ascending order,
+        starting after the position encoded in the
+        *after* token. Unlike slicing, earlier nodes are
+        skipped using the index instead of being read
+        and discarded, so that every page costs the same
+        for single-hop queries. Interned nodes are in
+        the order of their ids.
+
+        :param after: The token of the previous page, or
+            ``None`` to fetch the first page.
+        :param size: The maximum number of nodes, at
+            least 1.
+        """
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        name = 'page%d' % (len(self.ctes) + 1)
+        smt, params = SQL.keyset_page(name, after is not None)
+        if after is not None:
+            after = self.graph.marked_node(_decode_token(after))
+            params = (after,) + params
+        query = Query(
+            graph=self.graph,
+            sql=(smt,),
+            params=self.params + params + (size,),
+            ctes=self.ctes + (
+                SQL.traversal_stage(name, '\n'.join(self.sql)),
+            ),
+        )
+        items = query.to(list)
+        token = None
+        if len(items) == size:
+            token = _encode_token(items[-1])
+        return Page(items, token)
+
+    def to_array(self, typecode='Q'):
+        """
+        Returns the selected nodes in an ``array.array``
+        of the given *typecode*, which stores them as
+        machine integers instead of Python objects. The
+        array can be handed to NumPy without copying via
+        ``numpy.frombuffer(arr, dtype=numpy.uint64)``.
+
+        :param typecode: The typecode of the array.
+        """
+        nodes = array(typecode)
+        for batch in self.batches():
+            nodes.extend(batch)
+        return nodes
+
     def to(self, datatype):
         """
         Converts this iterable into another *datatype*
@@ -194,4 +666,22 @@ class Query(object):
 
         :param datatype: The datatype.
         """
+        if datatype is tuple:
+            nodes = self.cached()
+            if nodes is not None:
+                return nodes
         return datatype(self)
+
+
+def _encode_token(node):
+    data = json.dumps([node]).encode('utf-8')
+    return urlsafe_b64encode(data).decode('ascii')
+
+
+def _decode_token(token):
+    try:
+        node, = json.loads(urlsafe_b64decode(token.encode('ascii'))
+                           .decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('invalid page token: %r' % (token,))
+    return node
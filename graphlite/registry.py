@@ -0,0 +1,179 @@
+"""
+    graphlite.registry
+    ~~~~~~~~~~~~~~~~~~
+    Keeps track of the relations of a database in a
+    table which is read once when a graph is opened, so
+    that relations which are already set up cost no DDL
+    and new ones can be created on demand.
+"""
+
+from contextlib import closing
+from sqlite3 import OperationalError
+
+from graphlite.hooks import Hooks
+import graphlite.sql as SQL
+
+
+class Registry(object):
+    """
+    Sets up the tables of relations, and records every
+    relation along with the ``(properties, degrees)``
+    signature it was last set up with. The storage layout
+    of every table is read from its schema.
+
+    :param layout: The storage layout of new relations.
+    :param properties: A dictionary mapping relations to
+        the ``(name, type)`` tuples of their properties.
+    :param degrees: Whether relations have degree tables.
+    :param hooks: The :class:`graphlite.hooks.Hooks` to
+        report the executed statements to.
+    """
+
+    def __init__(self, layout=SQL.ROWID, properties=None, degrees=False,
+                 hooks=None):
+        self.hooks = Hooks() if hooks is None else hooks
+        self.layout = layout
+        self.properties = properties or {}
+        self.degrees = degrees
+        self.relations = {}
+        self.layouts = {}
+        self.created = set()
+
+    def load(self, cursor):
+        """
+        Reads the registry and the layouts of the tables
+        of the database, returning ``False`` if it does
+        not have a registry yet.
+
+        :param cursor: The cursor to use.
+        """
+        tables = self.hooks.fetchall(cursor, SQL.SELECT_TABLES)
+        self.layouts = dict(
+            (name, SQL.table_layout(sql)) for name, sql in tables
+        )
+        try:
+            relations = self.hooks.fetchall(cursor, SQL.SELECT_RELATIONS)
+        except OperationalError:
+            return False
+        self.relations = dict(
+            (name, (properties, bool(degrees)))
+            for name, properties, degrees in relations
+        )
+        return True
+
+    def signature(self, table):
+        """
+        Returns the ``(properties, degrees)`` signature
+        the relation *table* is to be set up with.
+
+        :param table: The relation.
+        """
+        properties = ', '.join(
+            '%s %s' % column for column in self.properties.get(table, ())
+        )
+        return properties, bool(self.degrees)
+
+    def current(self, table):
+        """
+        Returns whether the relation *table* is registered
+        as set up with its current signature.
+
+        :param table: The relation.
+        """
+        return self.relations.get(table) == self.signature(table)
+
+    def setup(self, cursor, table):
+        """
+        Creates the table and indexes of the relation
+        *table* along with its edge properties and degree
+        table, and registers it. Existing tables keep
+        their layout.
+
+        :param cursor: The cursor to use.
+        :param table: The relation.
+        """
+        layout = self.layouts.get(table, self.layout)
+        create_table, indexes = SQL.LAYOUTS[layout]
+        self.hooks.execute(cursor, create_table % (table))
+        self.layouts[table] = layout
+        for index in indexes:
+            self.hooks.execute(cursor, index % {'table': table})
+        self.setup_properties(cursor, table)
+        if self.degrees:
+            self.setup_degrees(cursor, table)
+        properties, degrees = signature = self.signature(table)
+        self.hooks.execute(cursor, SQL.REGISTER_RELATION,
+                           (table, properties, int(degrees)))
+        self.relations[table] = signature
+
+    def setup_properties(self, cursor, table):
+        """
+        Adds the columns of the declared properties of
+        the relation *table* which it does not have yet,
+        and indexes them.
+
+        :param cursor: The cursor to use.
+        :param table: The relation.
+        """
+        properties = self.properties.get(table)
+        if not properties:
+            return
+        columns = self.hooks.fetchall(cursor, 'PRAGMA table_info(%s)' % table)
+        existing = set(row[1] for row in columns)
+        for name, kind in properties:
+            names = {'table': table, 'column': name, 'type': kind}
+            if name not in existing:
+                self.hooks.execute(cursor, SQL.ADD_PROPERTY % names)
+            for index in SQL.PROPERTY_INDEXES:
+                self.hooks.execute(cursor, index % names)
+
+    def setup_degrees(self, cursor, table):
+        """
+        Creates the degree table of the relation *table*
+        along with the triggers maintaining it, and fills
+        it in if it is empty.
+
+        :param cursor: The cursor to use.
+        :param table: The relation.
+        """
+        statements = (
+            (SQL.CREATE_DEGREE_TABLE,) +
+            SQL.DEGREE_INDEXES +
+            SQL.DEGREE_TRIGGERS +
+            (SQL.BACKFILL_DEGREES,)
+        )
+        for smt in statements:
+            self.hooks.execute(cursor, smt % {'table': table})
+
+    def ensure(self, db, table):
+        """
+        Creates the relation *table* within the running
+        transaction unless it is known. Only unknown
+        names are validated.
+
+        :param db: The SQLite connection.
+        :param table: The relation.
+        """
+        if table in self.relations:
+            return
+        with closing(db.cursor()) as cursor:
+            self.setup(cursor, SQL.relation(table))
+        self.created.add(table)
+
+    def commit(self):
+        """
+        Keeps the relations created by :meth:`ensure`
+        since the last commit or rollback.
+        """
+        self.created.clear()
+
+    def rollback(self):
+        """
+        Forgets the relations created by :meth:`ensure`
+        since the last commit or rollback, whose tables
+        were rolled back.
+        """
+        for table in self.created:
+            self.relations.pop(table, None)
+            self.layouts.pop(table, None)
+        self.created.clear()
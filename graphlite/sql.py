@@ -1,3 +1,7 @@
+import re
+from itertools import groupby
+
+
 CREATE_TABLE = '''\
 CREATE TABLE IF NOT EXISTS %s
 (
@@ -6,13 +10,289 @@ CREATE TABLE IF NOT EXISTS %s
 )
 '''
 
+CREATE_CLUSTERED_TABLE = '''\
+CREATE TABLE IF NOT EXISTS %s
+(
+    src UNSIGNED INTEGER NOT NULL,
+    dst UNSIGNED INTEGER NOT NULL,
+    PRIMARY KEY (src, dst)
+) WITHOUT ROWID
+'''
+
 INDEXES = (
-    'CREATE INDEX IF NOT EXISTS src_index ON %s ( src );',
-    'CREATE INDEX IF NOT EXISTS dst_index ON %s ( dst );',
+    'CREATE INDEX IF NOT EXISTS %(table)s_src_dst ON %(table)s ( src, dst );',
+    'CREATE INDEX IF NOT EXISTS %(table)s_dst_src ON %(table)s ( dst, src );',
+)
+
+CLUSTERED_INDEXES = INDEXES[1:]
+
+LEGACY_INDEXES = ('src_index', 'dst_index')
+
+#: Edges are stored in a plain rowid table with two
+#: secondary indexes, and duplicate edges are allowed.
+ROWID = 'rowid'
+
+#: Edges are stored in a ``WITHOUT ROWID`` table
+#: clustered on ``(src, dst)``, so duplicate edges are
+#: ignored and only the reverse index is needed.
+CLUSTERED = 'clustered'
+
+LAYOUTS = {
+    ROWID: (CREATE_TABLE, INDEXES),
+    CLUSTERED: (CREATE_CLUSTERED_TABLE, CLUSTERED_INDEXES),
+}
+
+SELECT_TABLES = "SELECT name, sql FROM sqlite_master WHERE type = 'table'"
+
+#: The out-degree of nodes, i.e. their number of edges
+#: as the source node.
+OUT = 'out'
+
+#: The in-degree of nodes, i.e. their number of edges
+#: as the destination node.
+IN = 'in'
+
+#: The sum of the out-degree and the in-degree.
+BOTH = 'both'
+
+DEGREE_COLUMNS = {
+    OUT: 'out_degree',
+    IN: 'in_degree',
+    BOTH: 'out_degree + in_degree',
+}
+
+CREATE_DEGREE_TABLE = '''\
+CREATE TABLE IF NOT EXISTS %(table)s_degree
+(
+    node UNSIGNED INTEGER NOT NULL PRIMARY KEY,
+    out_degree INTEGER NOT NULL DEFAULT 0,
+    in_degree INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID
+'''
+
+DEGREE_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS %(table)s_degree_out '
+    'ON %(table)s_degree ( out_degree );',
+    'CREATE INDEX IF NOT EXISTS %(table)s_degree_in '
+    'ON %(table)s_degree ( in_degree );',
 )
 
+#: Triggers keeping the degree table of a relation up to
+#: date. They fire once per inserted or deleted row, so
+#: edges ignored by ``INSERT OR IGNORE`` and edges matched
+#: by wildcard deletes are counted correctly.
+DEGREE_TRIGGERS = (
+    '''\
+CREATE TRIGGER IF NOT EXISTS %(table)s_degree_insert
+AFTER INSERT ON %(table)s
+BEGIN
+    INSERT OR IGNORE INTO %(table)s_degree (node)
+        VALUES (NEW.src), (NEW.dst);
+    UPDATE %(table)s_degree SET out_degree = out_degree + 1
+        WHERE node = NEW.src;
+    UPDATE %(table)s_degree SET in_degree = in_degree + 1
+        WHERE node = NEW.dst;
+END
+''',
+    '''\
+CREATE TRIGGER IF NOT EXISTS %(table)s_degree_delete
+AFTER DELETE ON %(table)s
+BEGIN
+    UPDATE %(table)s_degree SET out_degree = out_degree - 1
+        WHERE node = OLD.src;
+    UPDATE %(table)s_degree SET in_degree = in_degree - 1
+        WHERE node = OLD.dst;
+    DELETE FROM %(table)s_degree
+        WHERE node IN (OLD.src, OLD.dst)
+        AND out_degree = 0 AND in_degree = 0;
+END
+''',
+)
+
+DROP_DEGREE_TRIGGERS = (
+    'DROP TRIGGER IF EXISTS %(table)s_degree_insert',
+    'DROP TRIGGER IF EXISTS %(table)s_degree_delete',
+)
+
+#: Counts the degrees of every node of a relation into
+#: its degree table, unless it has already been filled.
+BACKFILL_DEGREES = '''\
+INSERT INTO %(table)s_degree (node, out_degree, in_degree)
+SELECT node, SUM(out_degree), SUM(in_degree) FROM (
+    SELECT src AS node, 1 AS out_degree, 0 AS in_degree FROM %(table)s
+    UNION ALL
+    SELECT dst, 0, 1 FROM %(table)s
+)
+WHERE NOT EXISTS (SELECT 1 FROM %(table)s_degree)
+GROUP BY node
+'''
+
+#: The types that edge properties may be declared with.
+PROPERTY_TYPES = ('INTEGER', 'REAL', 'TEXT', 'BLOB', 'NUMERIC')
 
-def store(src, rel, dst):
+ADD_PROPERTY = 'ALTER TABLE %(table)s ADD COLUMN %(column)s %(type)s'
+
+#: Indexes on every edge property, so that the edges of
+#: a node can be filtered on and ordered by the property
+#: without reading the table.
+PROPERTY_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS %(table)s_src_%(column)s '
+    'ON %(table)s ( src, %(column)s, dst );',
+    'CREATE INDEX IF NOT EXISTS %(table)s_dst_%(column)s '
+    'ON %(table)s ( dst, %(column)s, src );',
+)
+
+#: The comparison operators of edge property filters.
+OPERATORS = {
+    'eq': '=',
+    'ne': '!=',
+    'lt': '<',
+    'lte': '<=',
+    'gt': '>',
+    'gte': '>=',
+}
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+#: The relations of a database along with the edge
+#: properties and degree tables they were set up with,
+#: so that relations which are up to date can be skipped
+#: when a graph is opened.
+CREATE_RELATIONS = '''\
+CREATE TABLE IF NOT EXISTS graphlite_relations
+(
+    name TEXT NOT NULL PRIMARY KEY,
+    properties TEXT NOT NULL,
+    degrees INTEGER NOT NULL
+) WITHOUT ROWID
+'''
+
+SELECT_RELATIONS = 'SELECT name, properties, degrees FROM graphlite_relations'
+
+REGISTER_RELATION = '''\
+INSERT OR REPLACE INTO graphlite_relations (name, properties, degrees)
+VALUES (?, ?, ?)
+'''
+
+#: The node dictionary of graphs with interned nodes,
+#: mapping node keys to the ids stored in the edges.
+CREATE_NODES = '''\
+CREATE TABLE IF NOT EXISTS graphlite_nodes
+(
+    id INTEGER PRIMARY KEY,
+    key NOT NULL UNIQUE
+)
+'''
+
+INSERT_NODE = 'INSERT OR IGNORE INTO graphlite_nodes (key) VALUES (?)'
+
+LIST_INDEXES = '''\
+SELECT name, sql FROM sqlite_master
+WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL
+'''
+
+
+def identifier(name):
+    """
+    Returns *name* if it can be used as the name of an
+    edge property in SQL, otherwise raises a
+    ``ValueError``.
+
+    :param name: The name.
+    """
+    if not _IDENTIFIER.match(name) or name in ('src', 'dst'):
+        raise ValueError('invalid property name: %r' % (name,))
+    return name
+
+
+def table_layout(sql):
+    """
+    Returns the storage layout of a relation given the
+    SQL of its table, which is kept by the layout it
+    was created with and not by the one of the graph.
+
+    :param sql: The ``CREATE TABLE`` statement.
+    """
+    return CLUSTERED if 'WITHOUT ROWID' in sql.upper() else ROWID
+
+
+def relation(name):
+    """
+    Returns *name* if it can be used as the name of a
+    relation, otherwise raises a ``ValueError``. Names
+    of the tables of SQLite and Graphlite are reserved.
+
+    :param name: The name.
+    """
+    reserved = name.lower().startswith(('sqlite_', 'graphlite_'))
+    if not _IDENTIFIER.match(name) or reserved:
+        raise ValueError('invalid relation name: %r' % (name,))
+    return name
+
+
+def property_schema(graphs):
+    """
+    Returns a dictionary mapping every relation to the
+    sorted ``(name, type)`` tuples of its properties,
+    given either relation names or a dictionary mapping
+    relations to dictionaries of property types.
+
+    :param graphs: The graphs.
+    """
+    if not isinstance(graphs, dict):
+        return {}
+    schema = {}
+    for rel, properties in graphs.items():
+        columns = []
+        for name, kind in sorted((properties or {}).items()):
+            if kind.upper() not in PROPERTY_TYPES:
+                raise ValueError('invalid property type: %r' % (kind,))
+            columns.append((identifier(name), kind.upper()))
+        schema[rel] = tuple(columns)
+    return schema
+
+
+def conditions(filters, alias=None):
+    """
+    Returns the SQL conditions of edge property
+    *filters*, each comparing a property to a parameter.
+
+    :param filters: An iterable of ``(name, operator)``
+        or ``(name, operator, value)`` tuples.
+    :param alias: The alias of the relation, if any.
+    """
+    prefix = '%s.' % alias if alias else ''
+    return ['%s%s %s ?' % (prefix, f[0], OPERATORS[f[1]]) for f in filters]
+
+
+def refine(smt, params, filters=(), ordering=(), alias=None, where=True):
+    """
+    Appends the conditions of the edge property
+    *filters* and the *ordering* to a SELECT statement
+    and its parameters.
+
+    :param smt: The SQL statement.
+    :param params: The parameters of the statement.
+    :param filters: ``(name, operator, value)`` tuples.
+    :param ordering: ``(name, descending)`` tuples.
+    :param alias: The alias of the relation, if any.
+    :param where: Whether the statement already has a
+        ``WHERE`` clause.
+    """
+    if filters:
+        smt = '%s %s %s' % (
+            smt, 'AND' if where else 'WHERE',
+            ' AND '.join(conditions(filters, alias)))
+        params = tuple(params) + tuple(f[2] for f in filters)
+    if ordering:
+        prefix = '%s.' % alias if alias else ''
+        smt = '%s ORDER BY %s' % (smt, ', '.join(
+            '%s%s%s' % (prefix, name, ' DESC' if descending else '')
+            for name, descending in ordering))
+    return smt, params
+
+
+def store(src, rel, dst, layout=ROWID):
     """
     Returns an SQL statement to store an edge into
     the SQL backing store.
@@ -20,9 +300,35 @@ def store(src, rel, dst):
     :param src: The source node.
     :param rel: The relation.
     :param dst: The destination node.
+    :param layout: The storage layout of the relation.
+    """
+    return store_template(rel, layout), (src, dst)
+
+
+def store_template(rel, layout=ROWID, columns=()):
+    """
+    Returns the parameterised INSERT statement for
+    the given relation, shared by every edge stored
+    into it. Duplicate edges are ignored if the
+    relation uses the clustered layout, apart from
+    updating their property *columns*.
+
+    :param rel: The relation.
+    :param layout: The storage layout of the relation.
+    :param columns: The names of the properties stored
+        along with the nodes.
     """
-    smt = 'INSERT INTO %s (src, dst) VALUES (?, ?)'
-    return smt % rel, (src, dst)
+    smt = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        rel,
+        ', '.join(('src', 'dst') + tuple(columns)),
+        ', '.join('?' * (len(columns) + 2)),
+    )
+    if layout != CLUSTERED:
+        return smt
+    if not columns:
+        return smt.replace('INSERT', 'INSERT OR IGNORE', 1)
+    return '%s ON CONFLICT (src, dst) DO UPDATE SET %s' % (smt, ', '.join(
+        '%s = excluded.%s' % (name, name) for name in columns))
 
 
 def remove(src, rel, dst):
@@ -35,22 +341,165 @@ def remove(src, rel, dst):
     :param rel: The relation.
     :param dst: The destination node.
     """
+    smt = remove_template(rel, src is not None, dst is not None)
+    return smt, [node for node in (src, dst) if node is not None]
+
+
+def remove_template(rel, has_src, has_dst, filters=()):
+    """
+    Returns the parameterised DELETE statement for
+    edges of a relation, filtering on the source
+    and/or destination node if required.
+
+    :param rel: The relation.
+    :param has_src: Whether to filter on the source.
+    :param has_dst: Whether to filter on the destination.
+    :param filters: ``(name, operator)`` tuples of the
+        edge property filters.
+    """
     smt = 'DELETE FROM %s' % rel
     queries = []
-    params = []
 
-    if src is not None:
+    if has_src:
         queries.append('src = ?')
-        params.append(src)
 
-    if dst is not None:
+    if has_dst:
         queries.append('dst = ?')
-        params.append(dst)
+
+    queries.extend(conditions(filters))
 
     if not queries:
-        return smt, params
-    smt = '%s WHERE %s' % (smt, ' AND '.join(queries))
-    return smt, params
+        return smt
+    return '%s WHERE %s' % (smt, ' AND '.join(queries))
+
+
+def store_many(edges, layout=ROWID, layouts=None):
+    """
+    Groups consecutive *edges* sharing a relation and
+    the names of their property values, and yields an
+    INSERT statement along with a lazy iterable of
+    parameters for every group, suitable for
+    ``executemany``.
+
+    :param edges: An iterable of edges.
+    :param layout: The storage layout of the relations.
+    :param layouts: A dictionary mapping relations to
+        their storage layouts, overriding *layout*.
+    """
+    layouts = layouts or {}
+    for (rel, columns), group in groupby(edges, key=_store_shape):
+        yield store_template(rel, layouts.get(rel, layout), columns), (
+            (e.src, e.dst) + tuple(value for __, value in e._values)
+            for e in group
+        )
+
+
+def _store_shape(edge):
+    if not edge._values:
+        return edge.rel, ()
+    return edge.rel, tuple(name for name, __ in edge._values)
+
+
+def _remove_shape(edge):
+    return (
+        edge.rel, edge.src is not None, edge.dst is not None,
+        tuple(f[:2] for f in edge._filters),
+    )
+
+
+def remove_many(edges):
+    """
+    Similar to :meth:`store_many` but groups the
+    *edges* by relation and by which of the source
+    and destination nodes are specified, yielding
+    DELETE statements instead.
+
+    :param edges: An iterable of edges.
+    """
+    for shape, group in groupby(edges, key=_remove_shape):
+        yield remove_template(*shape), (
+            [node for node in (e.src, e.dst) if node is not None] +
+            [f[2] for f in e._filters]
+            for e in group
+        )
+
+
+#: Deletes of fewer edge queries than this are ran one
+#: statement per edge query instead of being staged.
+STAGE_THRESHOLD = 64
+
+#: A temporary table holding the edge queries of a large
+#: delete, keyed by relation, which are then deleted with
+#: one statement per relation and shape.
+STAGE_DELETES = (
+    '''\
+CREATE TEMP TABLE IF NOT EXISTS graphlite_deleted
+(
+    rel TEXT NOT NULL,
+    src,
+    dst
+)
+''',
+    'CREATE INDEX IF NOT EXISTS temp.graphlite_deleted_rel '
+    'ON graphlite_deleted ( rel, src, dst );',
+)
+
+INSERT_STAGED = '''\
+INSERT INTO temp.graphlite_deleted (rel, src, dst) VALUES (?, ?, ?)
+'''
+
+SELECT_STAGED_SHAPES = '''\
+SELECT DISTINCT rel, src IS NOT NULL, dst IS NOT NULL
+FROM temp.graphlite_deleted
+'''
+
+CLEAR_STAGED = 'DELETE FROM temp.graphlite_deleted'
+
+
+def remove_staged(rel, has_src, has_dst):
+    """
+    Returns the DELETE statement removing the edges of
+    a relation matched by the edge queries of a shape in
+    the ``graphlite_deleted`` table, which takes the
+    relation as its parameter unless the whole relation
+    is deleted.
+
+    :param rel: The relation.
+    :param has_src: Whether the edge queries have a
+        source node.
+    :param has_dst: Whether the edge queries have a
+        destination node.
+    """
+    if not (has_src or has_dst):
+        return 'DELETE FROM %s' % rel, ()
+    columns = [name for name, given in (('src', has_src), ('dst', has_dst))
+               if given]
+    selected = ', '.join(columns)
+    smt = (
+        'DELETE FROM %s WHERE %s IN (SELECT %s FROM temp.graphlite_deleted '
+        'WHERE rel = ? AND src IS %s AND dst IS %s)'
+    ) % (
+        rel,
+        selected if len(columns) == 1 else '(%s)' % selected,
+        selected,
+        'NOT NULL' if has_src else 'NULL',
+        'NOT NULL' if has_dst else 'NULL',
+    )
+    return smt, (rel,)
+
+
+def remove_query(rel, query, inverse=False):
+    """
+    Returns a DELETE statement removing the edges of a
+    relation whose source nodes, or destination nodes if
+    *inverse*, are selected by the *query*.
+
+    :param rel: The relation.
+    :param query: The SQL query selecting the nodes.
+    :param inverse: Whether to match destination nodes.
+    """
+    return 'DELETE FROM %s WHERE %s IN (%s)' % (
+        rel, 'dst' if inverse else 'src', query)
 
 
 def forwards_relation(src, rel):
@@ -77,7 +526,7 @@ def inverse_relation(dst, rel):
     return statement % rel, (dst,)
 
 
-def select_one(src, rel, dst):
+def select_one(src, rel, dst, filters=()):
     """
     Create an SQL query that selects one ID from a
     relation table given a source and destination node.
@@ -85,12 +534,14 @@ def select_one(src, rel, dst):
     :param src: The source node.
     :param rel: The relation.
     :param dst: The destination node.
+    :param filters: Edge property filters.
     """
-    smt = 'SELECT src FROM %s WHERE src = ? AND dst = ? LIMIT 1'
-    return smt % rel, (src, dst)
+    smt, params = refine('SELECT src FROM %s WHERE src = ? AND dst = ?' % rel,
+                         (src, dst), filters)
+    return smt + ' LIMIT 1', params
 
 
-def compound_fwd_query(query, rel):
+def compound_fwd_query(query, rel, filters=(), ordering=()):
     """
     Create a compound forwards query that selects the
     destination nodes, which have source nodes within
@@ -98,12 +549,14 @@ def compound_fwd_query(query, rel):
 
     :param query: The subquery.
     :param rel: The relation.
+    :param filters: Edge property filters.
+    :param ordering: The edge properties to order by.
     """
     smt = 'SELECT dst FROM %s WHERE src IN (%s)'
-    return smt % (rel, query), ()
+    return refine(smt % (rel, query), (), filters, ordering)
 
 
-def compound_inv_query(query, rel, dst):
+def compound_inv_query(query, rel, dst, filters=(), ordering=()):
     """
     Create a compound inverse query, similar to
     :meth:``compound_fw_query`` but only selects the
@@ -112,9 +565,327 @@ def compound_inv_query(query, rel, dst):
     :param query: The SQL subquery.
     :param rel: The relation.
     :param dst: The destination node.
+    :param filters: Edge property filters.
+    :param ordering: The edge properties to order by.
     """
     smt = 'SELECT src FROM %s WHERE src IN (%s) AND dst = ?'
-    return smt % (rel, query), (dst,)
+    return refine(smt % (rel, query), (dst,), filters, ordering)
+
+
+def traversal_stage(name, query):
+    """
+    Wraps *query* in a named common table expression
+    with a single ``id`` column, so that a later hop
+    of a traversal can join against its results.
+
+    :param name: The name of the stage.
+    :param query: The SQL query of the stage.
+    """
+    return '%s(id) AS (%s)' % (name, query)
+
+
+def join_fwd_query(stage, rel, filters=(), ordering=()):
+    """
+    Create a forwards query that selects the
+    destination nodes of the distinct source nodes
+    selected by the traversal *stage*, using a JOIN.
+
+    :param stage: The name of the stage.
+    :param rel: The relation.
+    :param filters: Edge property filters.
+    :param ordering: The edge properties to order by.
+    """
+    smt = ('SELECT e.dst FROM %s AS e '
+           'JOIN (SELECT DISTINCT id FROM %s) AS f ON e.src = f.id')
+    return refine(smt % (rel, stage), (), filters, ordering,
+                  alias='e', where=False)
+
+
+def join_inv_query(stage, rel, dst, filters=(), ordering=()):
+    """
+    Similar to :meth:`join_fwd_query` but only selects
+    the source nodes that are related to the given
+    destination node.
+
+    :param stage: The name of the stage.
+    :param rel: The relation.
+    :param dst: The destination node.
+    :param filters: Edge property filters.
+    :param ordering: The edge properties to order by.
+    """
+    smt = ('SELECT e.src FROM %s AS e '
+           'JOIN (SELECT DISTINCT id FROM %s) AS f ON e.src = f.id '
+           'WHERE e.dst = ?')
+    return refine(smt % (rel, stage), (dst,), filters, ordering, alias='e')
+
+
+def reachable_stage(name, seed, rel, inverse=False, depth=None,
+                    filters=()):
+    """
+    Create a recursive common table expression that
+    selects the nodes reachable from the nodes of the
+    *seed* stage in one or more hops. Without a *depth*
+    limit cycles are suppressed by selecting distinct
+    nodes only, otherwise the expression selects
+    ``(id, depth)`` pairs and the number of hops is
+    bounded by the limit.
+
+    :param name: The name of the stage.
+    :param seed: The name of the seed stage.
+    :param rel: The relation.
+    :param inverse: Whether to walk the edges backwards.
+    :param depth: The maximum number of hops.
+    :param filters: Edge property filters that every
+        edge on the way has to match.
+    """
+    matches = conditions(filters, 'e')
+    values = tuple(f[2] for f in filters)
+    cols = {
+        'name': name,
+        'seed': seed,
+        'rel': rel,
+        'src': 'dst' if inverse else 'src',
+        'dst': 'src' if inverse else 'dst',
+        'where': ''.join(' AND %s' % match for match in matches),
+    }
+    if depth is None:
+        smt = ('%(name)s(id) AS ('
+               'SELECT e.%(dst)s FROM %(rel)s AS e '
+               'JOIN (SELECT DISTINCT id FROM %(seed)s) AS f '
+               'ON e.%(src)s = f.id%(where)s '
+               'UNION '
+               'SELECT e.%(dst)s FROM %(rel)s AS e '
+               'JOIN %(name)s AS r ON e.%(src)s = r.id%(where)s)')
+        return smt % cols, values + values
+
+    smt = ('%(name)s(id, depth) AS ('
+           'SELECT e.%(dst)s, 1 FROM %(rel)s AS e '
+           'JOIN (SELECT DISTINCT id FROM %(seed)s) AS f '
+           'ON e.%(src)s = f.id%(where)s '
+           'UNION '
+           'SELECT e.%(dst)s, r.depth + 1 FROM %(rel)s AS e '
+           'JOIN %(name)s AS r ON e.%(src)s = r.id%(where)s '
+           'WHERE r.depth < ?)')
+    return smt % cols, values + values + (depth,)
+
+
+def adjacent(rel, count, inverse=False, filters=()):
+    """
+    Returns an SQL query that selects ``(index,
+    neighbour)`` pairs of a relation for *count*
+    distinct source nodes, or destination nodes if
+    *inverse*, followed by the values of the *filters*.
+    The *index* is the position of the node among the
+    parameters, as SQLite may convert the node to the
+    affinity of the column.
+
+    :param rel: The relation.
+    :param count: The number of nodes.
+    :param inverse: Whether to select by destination.
+    :param filters: ``(name, operator)`` tuples of the
+        edge property filters.
+    """
+    smt = ('WITH batch(i, node) AS (VALUES %s) '
+           'SELECT b.i, r.%s FROM batch AS b JOIN %s AS r ON r.%s = b.node')
+    col, key = ('src', 'dst') if inverse else ('dst', 'src')
+    nodes = ', '.join('(%d, ?)' % i for i in range(count))
+    smt = smt % (nodes, col, rel, key)
+    return ' AND '.join([smt] + conditions(filters, 'r'))
+
+
+def keyset_page(stage, after):
+    """
+    Returns an SQL query that selects a page of the
+    distinct nodes of a *stage* in ascending order,
+    optionally only those *after* a given node. The
+    node and the page size are left as parameters.
+
+    :param stage: The name of the stage.
+    :param after: Whether to select nodes after a node.
+    """
+    where = 'WHERE id > ? ' if after else ''
+    smt = 'SELECT DISTINCT id FROM %s %sORDER BY id LIMIT ?'
+    return smt % (stage, where), ()
+
+
+#: The number of nodes an operand of an intersection is
+#: counted up to when choosing which one to scan.
+SIZE_LIMIT = 1000
+
+
+def operand_size(rel, inverse):
+    """
+    Returns an SQL query that counts the nodes selected
+    by an edge query, up to :data:`SIZE_LIMIT`, given its
+    node as a parameter.
+
+    :param rel: The relation.
+    :param inverse: Whether the node is the destination.
+    """
+    smt = 'SELECT COUNT(*) FROM (SELECT 1 FROM %s WHERE %s = ? LIMIT %d)'
+    return smt % (rel, 'dst' if inverse else 'src', SIZE_LIMIT)
+
+
+def sizes_stage(name, sizes):
+    """
+    Wraps the *sizes* queries in a common table
+    expression with a single row, holding the size of
+    every operand in the columns ``n0``, ``n1``...
+
+    :param name: The name of the stage.
+    :param sizes: The queries returned by
+        :func:`operand_size`.
+    """
+    return '%s(%s) AS (SELECT %s)' % (
+        name,
+        ', '.join('n%d' % i for i in range(len(sizes))),
+        ', '.join('(%s)' % smt for smt in sizes),
+    )
+
+
+def semi_join(rel, inverse, probes, stage=None, condition=None):
+    """
+    Returns an SQL query that selects the distinct nodes
+    of an edge query which are also selected, or not
+    selected, by each of the *probes*. The nodes of the
+    edge query are scanned and each probe is a single
+    lookup in the ``src_dst`` index of its relation.
+    The node of the edge query and then those of the
+    probes are left as parameters.
+
+    :param rel: The relation of the scanned edge query.
+    :param inverse: Whether it selects source nodes.
+    :param probes: A list of ``(rel, inverse, negate)``
+        tuples, one per probed edge query.
+    :param stage: The name of a stage to join first, so
+        that the *condition* on it is checked before the
+        relation is scanned.
+    :param condition: The condition on the stage.
+    """
+    col, key = ('s.src', 's.dst') if inverse else ('s.dst', 's.src')
+    where = ['%s = ?' % key]
+    for probe, probe_inverse, negate in probes:
+        smt = (
+            'EXISTS (SELECT 1 FROM %s WHERE src = %s AND dst = ?)'
+            if probe_inverse else
+            'EXISTS (SELECT 1 FROM %s WHERE src = ? AND dst = %s)'
+        )
+        where.append(('NOT ' if negate else '') + smt % (probe, col))
+    source = '%s AS s' % rel
+    if stage is not None:
+        source = '%s CROSS JOIN %s' % (stage, source)
+        where.insert(0, condition)
+    return 'SELECT DISTINCT %s FROM %s WHERE %s' % (
+        col, source, ' AND '.join(where))
+
+
+def _degree_column(direction):
+    try:
+        return DEGREE_COLUMNS[direction]
+    except KeyError:
+        raise ValueError('unknown direction: %r' % (direction,))
+
+
+def degree(rel, direction, materialized):
+    """
+    Returns an SQL query and the number of times the
+    node has to be passed as a parameter to select the
+    degree of a node, read from the degree table of the
+    relation if it is *materialized*, otherwise counted
+    from its edges.
+
+    :param rel: The relation.
+    :param direction: One of :data:`OUT`, :data:`IN`
+        or :data:`BOTH`.
+    :param materialized: Whether the relation has a
+        degree table.
+    """
+    column = _degree_column(direction)
+    if materialized:
+        smt = 'SELECT %s FROM %s_degree WHERE node = ?'
+        return smt % (column, rel), 1
+    counts = {
+        OUT: '(SELECT COUNT(*) FROM %(rel)s WHERE src = ?)',
+        IN: '(SELECT COUNT(*) FROM %(rel)s WHERE dst = ?)',
+    }
+    if direction == BOTH:
+        return 'SELECT %s + %s' % (counts[OUT], counts[IN]) % {'rel': rel}, 2
+    return 'SELECT %s' % counts[direction] % {'rel': rel}, 1
+
+
+def top_degrees(rel, direction, materialized):
+    """
+    Returns an SQL query that selects the ``(node,
+    degree)`` pairs with the highest degrees, leaving
+    the number of pairs as a parameter. Without a
+    degree table the edges are grouped and counted.
+
+    :param rel: The relation.
+    :param direction: One of :data:`OUT`, :data:`IN`
+        or :data:`BOTH`.
+    :param materialized: Whether the relation has a
+        degree table.
+    """
+    column = _degree_column(direction)
+    if materialized:
+        smt = 'SELECT node, %s FROM %s_degree ORDER BY 2 DESC LIMIT ?'
+        return smt % (column, rel)
+    nodes = {
+        OUT: 'SELECT src AS node FROM %(rel)s',
+        IN: 'SELECT dst AS node FROM %(rel)s',
+        BOTH: 'SELECT src AS node FROM %(rel)s '
+              'UNION ALL SELECT dst FROM %(rel)s',
+    }
+    smt = ('SELECT node, COUNT(*) FROM (%s) '
+           'GROUP BY node ORDER BY 2 DESC LIMIT ?')
+    return smt % nodes[direction] % {'rel': rel}
+
+
+COUNT_QUERY = 'SELECT COUNT(*) FROM (%s)'
+
+EXISTS_QUERY = 'SELECT 1 FROM (%s) LIMIT 1'
+
+
+def partition_hop(rel, nodes, dst=None, filters=()):
+    """
+    Returns an SQL query and parameters that run a
+    traversal hop from the given source *nodes*. If a
+    destination node is given then the source nodes
+    related to it are selected instead.
+
+    :param rel: The relation.
+    :param nodes: The source nodes.
+    :param dst: The destination node.
+    :param filters: Edge property filters.
+    """
+    marks = ', '.join('?' * len(nodes))
+    if dst is None:
+        smt = 'SELECT dst FROM %s WHERE src IN (%s)'
+        return refine(smt % (rel, marks), tuple(nodes), filters)
+    smt = 'SELECT src FROM %s WHERE dst = ? AND src IN (%s)'
+    return refine(smt % (rel, marks), (dst,) + tuple(nodes), filters)
+
+
+def select_ids(count):
+    """
+    Returns an SQL query selecting the ``(key, id)``
+    pairs of *count* node keys.
+
+    :param count: The number of keys.
+    """
+    smt = 'SELECT key, id FROM graphlite_nodes WHERE key IN (%s)'
+    return smt % ', '.join('?' * count)
+
+
+def select_keys(count):
+    """
+    Returns an SQL query selecting the ``(id, key)``
+    pairs of *count* node ids.
+
+    :param count: The number of ids.
+    """
+    smt = 'SELECT id, key FROM graphlite_nodes WHERE id IN (%s)'
+    return smt % ', '.join('?' * count)
 
 
 def limit(lower, upper):
@@ -127,5 +898,4 @@ def limit(lower, upper):
     """
     offset = lower or 0
     lim = (upper - offset) if upper else -1
-    smt = 'LIMIT %d OFFSET %d' % (lim, offset)
-    return smt, ()
+    return 'LIMIT ? OFFSET ?', (lim, offset)
@@ -1,7 +1,18 @@
 from contextlib import closing
+from functools import partial
+from itertools import chain, groupby, islice
+from threading import RLock
+
+from graphlite.hooks import Hooks
+from graphlite.query import V
+import graphlite.pragmas as PRAGMA
 import graphlite.sql as SQL
 
 
+def _filtered(edge):
+    return bool(edge._filters)
+
+
 class AbortSignal(Exception):
     """
     Signals that the transaction has been aborted.
@@ -16,10 +27,36 @@ class Transaction(object):
     until the transaction is committed.
 
     :param db: An SQLite connection.
+    :param layout: The storage layout of the relations.
+    :param layouts: A dictionary mapping relations to
+        their storage layouts, overriding *layout*.
+    :param lock: A lock held while committing, shared
+        by transactions on the same connection.
+    :param pragmas: Pragmas to set on the connection
+        while committing, restored afterwards.
+    :param cache: The adjacency cache to invalidate.
+    :param hooks: The :class:`graphlite.hooks.Hooks` to
+        report the executed statements to.
+    :param interner: The :class:`graphlite.interning.Interner`
+        translating node keys to ids, if nodes are interned.
+    :param registry: The :class:`graphlite.registry.Registry`
+        to create unknown relations with as edges are
+        stored, if any.
     """
 
-    def __init__(self, db):
+    def __init__(self, db, layout=SQL.ROWID, lock=None, pragmas=(),
+                 cache=None, hooks=None, interner=None, registry=None,
+                 layouts=None):
         self.db = db
+        self.layout = layout
+        self.layouts = layouts
+        self.lock = lock or RLock()
+        self.pragmas = pragmas
+        self.cache = cache
+        self.hooks = Hooks() if hooks is None else hooks
+        self.interner = interner
+        self.registry = registry
+        self.touched = set()
         self.ops = []
 
     def store_many(self, edges):
@@ -30,19 +67,37 @@ class Transaction(object):
 
         :param edges: An iterable of edges to store.
         """
-        self.ops.append((SQL.store, edges))
+        self.ops.append((self._storing, edges))
 
     def delete_many(self, edges):
         """
         Delete multiple edge queries from the database. Best
         used when you have a fairly large generator that
         shouldn't be loaded into memory at once for efficiency
-        reasons.
+        reasons. Large deletes are staged in a temporary
+        table and ran as one statement per relation.
 
         :param edges: An iterable of edges or ``Graph.find``
             style edge queries to delete.
         """
-        self.ops.append((SQL.remove, edges))
+        self.ops.append((self._removing, edges))
+
+    def delete_query(self, query, rel, inverse=False):
+        """
+        Deletes every edge of the relation *rel* whose
+        source node, or destination node if *inverse*, is
+        selected by the *query*, i.e. every edge of the
+        selected nodes. The nodes are selected by SQLite
+        within the DELETE statement instead of being
+        loaded into memory.
+
+        :param query: A :class:`graphlite.query.Query` of
+            the graph.
+        :param rel: The relation.
+        :param inverse: Whether to match destination nodes.
+        """
+        operation = partial(self._removing_query, query, inverse)
+        self.ops.append((operation, (V(rel=rel),)))
 
     def store(self, edge):
         """
@@ -73,24 +128,105 @@ class Transaction(object):
         self.clear()
         raise AbortSignal
 
+    def _invalidating(self, edges):
+        for edge in edges:
+            if edge.rel not in self.touched:
+                self.touched.add(edge.rel)
+                self.cache.begin(edge.rel)
+            self.cache.invalidate(edge)
+            yield edge
+
+    def _interned(self, edges, create):
+        if self.interner is None:
+            return edges
+        return self._interning(edges, create)
+
+    def _interning(self, edges, create):
+        edges = iter(edges)
+        while True:
+            chunk = list(islice(edges, self.interner.chunk))
+            if not chunk:
+                return
+            for edge in self.interner.encode_edges(self.db, chunk, create):
+                yield edge
+
+    def _registering(self, edges):
+        for edge in edges:
+            self.registry.ensure(self.db, edge.rel)
+            yield edge
+
+    def _storing(self, edges):
+        if self.registry is not None:
+            edges = self._registering(edges)
+        return SQL.store_many(self._interned(edges, True),
+                              layout=self.layout, layouts=self.layouts)
+
+    def _removing(self, edges):
+        edges = self._interned(edges, False)
+        for filtered, group in groupby(edges, key=_filtered):
+            head = list(islice(group, SQL.STAGE_THRESHOLD))
+            if filtered or len(head) < SQL.STAGE_THRESHOLD:
+                operations = SQL.remove_many(chain(head, group))
+            else:
+                operations = self._removing_staged(chain(head, group))
+            for smt, params in operations:
+                yield smt, params
+
+    def _removing_staged(self, edges):
+        for smt in SQL.STAGE_DELETES:
+            yield smt, ((),)
+        yield SQL.INSERT_STAGED, ((e.rel, e.src, e.dst) for e in edges)
+        with closing(self.db.cursor()) as cursor:
+            shapes = [shape for rows in self.hooks.fetch(
+                cursor, SQL.SELECT_STAGED_SHAPES, (), 100) for shape in rows]
+        for rel, has_src, has_dst in shapes:
+            smt, params = SQL.remove_staged(rel, has_src, has_dst)
+            yield smt, (params,)
+        yield SQL.CLEAR_STAGED, ((),)
+
+    def _removing_query(self, query, inverse, edges):
+        params = query.params
+        if self.interner is not None:
+            params = self.interner.bind(self.db, params)
+        for edge in edges:
+            smt = SQL.remove_query(edge.rel, query.statement, inverse)
+            yield smt, (params,)
+
     def _perform_ops(self, cursor):
         for operation, edges in self.ops:
-            for edge in edges:
-                cursor.execute(*operation(
-                    src=edge.src,
-                    rel=edge.rel,
-                    dst=edge.dst,
-                ))
+            if self.cache is not None:
+                edges = self._invalidating(edges)
+            for smt, params in operation(edges):
+                self.hooks.executemany(cursor, smt, params)
 
     def perform_ops(self):
         """
         Performs the stored operations on the database
         connection.
         """
-        with self.db:
-            with closing(self.db.cursor()) as cursor:
-                cursor.execute('BEGIN TRANSACTION')
-                self._perform_ops(cursor)
+        with self.lock:
+            previous = PRAGMA.apply(self.db, self.pragmas)
+            try:
+                with self.db:
+                    with closing(self.db.cursor()) as cursor:
+                        cursor.execute('BEGIN TRANSACTION')
+                        self._perform_ops(cursor)
+            except BaseException:
+                # ids assigned and relations created in the
+                # transaction were rolled back
+                if self.interner is not None:
+                    self.interner.clear()
+                if self.registry is not None:
+                    self.registry.rollback()
+                raise
+            else:
+                if self.registry is not None:
+                    self.registry.commit()
+            finally:
+                PRAGMA.apply(self.db, previous)
+                for rel in self.touched:
+                    self.cache.end(rel)
+                self.touched.clear()
 
     def clear(self):
         """
@@ -129,3 +265,209 @@ class Transaction(object):
         if not traceback and self.ops:
             self.commit()
         return isinstance(value, AbortSignal)
+
+
+class StreamingTransaction(Transaction):
+    """
+    A transaction which executes its operations in
+    batches of *size* edges as they are made, instead
+    of holding all of them until it is committed, so
+    that generators of edges are consumed as they are
+    passed in and memory use stays bounded.
+
+    The batches are written in a single SQLite
+    transaction which is committed at the end, each in
+    a savepoint so that a failed batch is rolled back on
+    its own and leaves the transaction usable. With
+    *checkpoint* every batch is committed instead, so
+    that a failed job can be resumed from the last
+    batch reported to *progress*. The write lock of the
+    graph is held from the first batch until the commit.
+
+    :param db: An SQLite connection.
+    :param size: The number of edges per batch.
+    :param checkpoint: Whether to commit every batch.
+    :param progress: A function called with the number
+        of edges written so far after every batch.
+    :param kwargs: Other arguments of :class:`Transaction`.
+    """
+
+    def __init__(self, db, size=10000, checkpoint=False, progress=None,
+                 **kwargs):
+        Transaction.__init__(self, db, **kwargs)
+        self.size = size
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.pending = 0
+        self.written = 0
+        self.previous = None
+
+    def store_many(self, edges):
+        """
+        Buffers the *edges* to store, writing a batch
+        every time enough edges are buffered.
+
+        :param edges: An iterable of edges to store.
+        """
+        self._buffer(self._storing, edges)
+
+    def delete_many(self, edges):
+        """
+        Buffers the edge queries to delete, similar to
+        :meth:`store_many`.
+
+        :param edges: An iterable of edges or ``Graph.find``
+            style edge queries to delete.
+        """
+        self._buffer(self._removing, edges)
+
+    def delete_query(self, query, rel, inverse=False):
+        """
+        Buffers the deletion of every edge of the nodes
+        selected by the *query*, which counts as a single
+        edge of a batch. See
+        :meth:`graphlite.transaction.Transaction.delete_query`.
+
+        :param query: A :class:`graphlite.query.Query` of
+            the graph.
+        :param rel: The relation.
+        :param inverse: Whether to match destination nodes.
+        """
+        operation = partial(self._removing_query, query, inverse)
+        self._buffer(operation, (V(rel=rel),))
+
+    def _buffer(self, operation, edges):
+        for edge in edges:
+            if self.ops and self.ops[-1][0] == operation:
+                self.ops[-1][1].append(edge)
+            else:
+                self.ops.append((operation, [edge]))
+            self.pending += 1
+            if self.pending >= self.size:
+                self.flush()
+
+    @property
+    def active(self):
+        """
+        Whether an SQLite transaction is open.
+        """
+        return self.previous is not None
+
+    def _begin(self):
+        self.lock.acquire()
+        try:
+            self.previous = PRAGMA.apply(self.db, self.pragmas)
+            self.db.execute('BEGIN TRANSACTION')
+        except BaseException:
+            self._end()
+            raise
+
+    def _end(self):
+        try:
+            PRAGMA.apply(self.db, self.previous or ())
+            for rel in self.touched:
+                self.cache.end(rel)
+            self.touched.clear()
+        finally:
+            self.previous = None
+            self.lock.release()
+
+    def _forget(self):
+        if self.interner is not None:
+            self.interner.clear()
+        if self.registry is not None:
+            self.registry.rollback()
+
+    def flush(self):
+        """
+        Writes the buffered operations as a batch.
+        """
+        if not self.ops:
+            return
+        count = self.pending
+        try:
+            if self.checkpoint:
+                self.perform_ops()
+            else:
+                self._perform_batch()
+        finally:
+            self.clear()
+        self.written += count
+        if self.progress is not None:
+            self.progress(self.written)
+
+    def _perform_batch(self):
+        if not self.active:
+            self._begin()
+        with closing(self.db.cursor()) as cursor:
+            cursor.execute('SAVEPOINT graphlite_batch')
+            try:
+                self._perform_ops(cursor)
+            except BaseException:
+                cursor.execute('ROLLBACK TO graphlite_batch')
+                cursor.execute('RELEASE graphlite_batch')
+                self._forget()
+                raise
+            cursor.execute('RELEASE graphlite_batch')
+
+    def clear(self):
+        """
+        Clears the buffered operations.
+        """
+        Transaction.clear(self)
+        self.pending = 0
+
+    def rollback(self):
+        """
+        Clears the buffered operations and rolls back
+        the batches written since the last commit.
+        """
+        self.clear()
+        if not self.active:
+            return
+        try:
+            self.db.rollback()
+            self._forget()
+        finally:
+            self._end()
+
+    def commit(self):
+        """
+        Writes the buffered operations and commits the
+        transaction. The transaction may be used again
+        afterwards.
+        """
+        try:
+            self.flush()
+        except BaseException:
+            self.rollback()
+            raise
+        if not self.active:
+            return
+        try:
+            self.db.commit()
+            if self.registry is not None:
+                self.registry.commit()
+        finally:
+            self._end()
+
+    def abort(self):
+        """
+        Rolls back the transaction and raises an
+        ``AbortSignal``. Batches which have already been
+        committed are kept.
+        """
+        self.rollback()
+        raise AbortSignal
+
+    def __exit__(self, type, value, traceback):
+        """
+        Commits the transaction if no exceptions were
+        raised, otherwise rolls it back. Ignores
+        ``AbortSignal``.
+        """
+        if traceback:
+            self.rollback()
+            return isinstance(value, AbortSignal)
+        self.commit()
+        return False
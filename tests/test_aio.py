@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from graphlite import V
+from graphlite.aio import connect
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+@pytest.fixture
+def graph(request):
+    async def setup():
+        g = await connect(':memory:', graphs=['knows'], batch_size=2)
+        async with g.transaction() as tr:
+            tr.store_many(V(1).knows(n) for n in (2, 3, 4, 5, 6))
+            tr.store(V(2).knows(1))
+        return g
+
+    g = run(setup())
+    request.addfinalizer(lambda: run(g.close()))
+    return g
+
+
+def test_async_iter(graph):
+    async def collect():
+        return [node async for node in graph.find(V(1).knows)]
+
+    assert run(collect()) == [2, 3, 4, 5, 6]
+
+
+def test_async_query(graph):
+    query = graph.find(V(1).knows).traverse(V().knows)
+    assert run(query.to(list)) == [1]
+    assert run(query.count()) == 1
+    assert run(query.exists())
+    assert run(graph.find(V(1).knows).difference(V(1).knows).first()) \
+        is None
+
+
+def test_async_query_slices(graph):
+    async def collect():
+        query = graph.find(V(1).knows)
+        batches = [batch async for batch in query.batches(3)]
+        nodes = [node async for node in query[1:3]]
+        return batches, nodes, await query.to_array()
+
+    batches, nodes, array = run(collect())
+    assert batches == [[2, 3, 4], [5, 6]]
+    assert nodes == [3, 4]
+    assert array.tolist() == [2, 3, 4, 5, 6]
+    with pytest.raises(ValueError):
+        graph.find(V(1).knows)[::2]
+
+
+def test_async_transaction(graph):
+    async def store_and_abort():
+        async with graph.transaction() as tr:
+            tr.store(V(7).knows(8))
+        async with graph.transaction() as tr:
+            tr.store(V(8).knows(9))
+            tr.abort()
+        return (await graph.contains(V(7).knows(8)),
+                await graph.contains(V(8).knows(9)))
+
+    assert run(store_and_abort()) == (True, False)
+
+
+def test_async_neighbors(graph):
+    assert run(graph.neighbors_many([2], 'knows')) == {2: [1]}
+    assert run(graph.shortest_path(2, 6, 'knows')) == [2, 1, 6]
+
+
+def test_async_delete_query(graph):
+    async def delete():
+        async with graph.transaction() as tr:
+            tr.delete_query(graph.find(V(2).knows), 'knows')
+        return await graph.find(V(1).knows).to(list)
+
+    assert run(delete()) == []
+
+
+def test_async_streaming_transaction(graph):
+    progress = []
+
+    async def stream():
+        async with graph.transaction(flush_every=2,
+                                     progress=progress.append) as tr:
+            await tr.store_many(V(7).knows(n) for n in range(3))
+            await tr.delete_query(graph.find(V(2).knows), 'knows')
+        async with graph.transaction(flush_every=2) as tr:
+            await tr.store_many(V(8).knows(n) for n in range(3))
+            await tr.abort()
+        return (await graph.find(V(7).knows).to(list),
+                await graph.find(V(1).knows).count(),
+                await graph.find(V(8).knows).count())
+
+    assert run(stream()) == ([0, 1, 2], 0, 0)
+    assert progress == [2, 4]
@@ -0,0 +1,53 @@
+from graphlite import V
+from graphlite.cache import AdjacencyCache, LRUCache
+
+
+def test_lru_eviction():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert 'b' not in cache
+    assert len(cache) == 2
+    assert cache.stats() == {'hits': 1, 'misses': 0, 'items': 2, 'maxsize': 2}
+
+
+def test_lru_miss():
+    cache = LRUCache(0)
+    cache.put('a', 1)
+
+    assert cache.get('a', 5) == 5
+    assert cache.misses == 1
+    assert cache.pop('a') is None
+
+
+def test_adjacency_invalidate():
+    cache = AdjacencyCache(10)
+    for key in [('knows', False, 1), ('knows', True, 2), ('knows', True, 3),
+                ('likes', True, 2)]:
+        cache.lookup(key, lambda: [1])
+
+    cache.invalidate(V(1).knows)
+    assert len(cache.entries) == 1
+    assert ('likes', True, 2) in cache.entries
+
+
+def test_adjacency_writing():
+    cache = AdjacencyCache(10)
+    key = ('knows', False, 1)
+
+    cache.begin('knows')
+    assert cache.lookup(key, lambda: [2]) == (2,)
+    assert key not in cache.entries
+
+    def load():
+        cache.end('knows')
+        return [2]
+
+    cache.lookup(key, load)
+    assert key not in cache.entries
+
+    cache.lookup(key, lambda: [3])
+    assert cache.lookup(key, lambda: [4]) == (3,)
@@ -1,6 +1,8 @@
 import pytest
-from graphlite import V
-from sqlite3 import ProgrammingError
+from graphlite import connect, V
+from graphlite.graph import ReadOnlyError, readonly_uri
+import graphlite.sql as SQL
+from sqlite3 import OperationalError, ProgrammingError
 
 
 def test_contains(graph):
@@ -11,3 +13,309 @@ def test_close(graph):
     graph.close()
     with pytest.raises(ProgrammingError):
         graph.db.execute('INSERT INTO knows (src,dst) VALUES (1,1)')
+
+
+def test_bulk_load(graph):
+    graph.bulk_load(V(n).likes(n + 1) for n in range(10, 20))
+
+    assert graph.find(V(10).likes).to(list) == [11]
+    assert V(1).knows(2) in graph
+    assert graph.db.execute('PRAGMA synchronous').fetchone() == (2,)
+
+
+def test_indexes(graph):
+    names = set(row[0] for row in graph.db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"))
+    assert names == set((
+        'knows_src_dst', 'knows_dst_src',
+        'likes_src_dst', 'likes_dst_src',
+    ))
+
+
+def test_legacy_indexes_migrated(graph):
+    graph.db.execute('CREATE INDEX src_index ON knows ( src )')
+    graph.db.execute('CREATE INDEX dst_index ON knows ( dst )')
+    graph.setup_sql(graph.graphs)
+
+    names = set(row[0] for row in graph.db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"))
+    assert 'src_index' not in names
+    assert 'dst_index' not in names
+    assert 'knows_src_dst' in names
+
+
+def test_clustered_layout():
+    graph = connect(':memory:', graphs=['knows'], layout='clustered')
+    sql, = graph.db.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'knows'").fetchone()
+    assert 'WITHOUT ROWID' in sql
+
+    graph.bulk_load(V(1).knows(n) for n in (2, 2, 3))
+    assert graph.find(V().knows(2)).to(list) == [1]
+    graph.close()
+
+
+def test_unknown_layout():
+    with pytest.raises(ValueError):
+        connect(':memory:', layout='columnar')
+
+
+def test_shortest_path(graph):
+    assert graph.shortest_path(2, 4, 'knows') == [2, 1, 4]
+    assert graph.shortest_path(1, 1, 'knows') == [1]
+    assert graph.shortest_path(1, 3, 'likes') == [1, 3]
+    assert graph.shortest_path(4, 1, 'knows') is None
+
+
+def test_statement_shapes(graph):
+    query = graph.find(V(1).knows)
+    assert query.statement == graph.find(V(2).knows).statement
+    assert query.to(list) == [2, 3, 4]
+
+
+def test_neighbors_many(graph):
+    assert graph.neighbors_many([1, 2, 4], 'knows') == {
+        1: [2, 3, 4],
+        2: [1],
+        4: [],
+    }
+    assert graph.neighbors_many(['1'], 'knows') == {'1': [2, 3, 4]}
+    assert graph.neighbors_many(['1'], 'knows', inverse=True) == {
+        '1': [2, 3],
+    }
+    assert graph.neighbors_many(iter([1, 2]), 'knows', inverse=True) == {
+        1: [2, 3],
+        2: [1],
+    }
+
+
+def test_neighbors_many_chunked(graph):
+    nodes = list(range(1, 1200))
+    neighbors = graph.neighbors_many(nodes, 'knows')
+    assert len(neighbors) == len(nodes)
+    assert neighbors[3] == [1]
+
+
+def test_profile(tmpdir):
+    graph = connect(str(tmpdir.join('graph.db')), graphs=['knows'],
+                    profile='fast')
+    pragma = lambda name: graph.db.execute('PRAGMA %s' % name).fetchone()[0]
+
+    assert pragma('journal_mode') == 'wal'
+    assert pragma('synchronous') == 1
+    assert pragma('cache_size') == -65536
+    assert pragma('page_size') == 8192
+    graph.close()
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        connect(':memory:', profile='reckless')
+
+
+def test_readonly(tmpdir):
+    path = str(tmpdir.join('graph.db'))
+    graph = connect(path, graphs=['knows'])
+    with graph.transaction() as tr:
+        tr.store(V(1).knows(2))
+    graph.close()
+
+    snapshot = connect(path, graphs=['knows'], readonly=True, mmap=2 ** 20)
+    assert snapshot.find(V(1).knows).to(list) == [2]
+    assert V(1).knows(2) in snapshot
+    assert snapshot.db.execute('PRAGMA mmap_size').fetchone() == (2 ** 20,)
+
+    with pytest.raises(ReadOnlyError):
+        snapshot.transaction()
+    with pytest.raises(ReadOnlyError):
+        snapshot.bulk_load([V(1).knows(3)])
+    with pytest.raises(OperationalError):
+        snapshot.db.execute('INSERT INTO knows (src, dst) VALUES (1, 3)')
+    snapshot.close()
+
+
+def test_readonly_memory():
+    with pytest.raises(ValueError):
+        connect(':memory:', readonly=True)
+
+
+def test_readonly_profile(tmpdir):
+    path = str(tmpdir.join('graph.db'))
+    with pytest.raises(ValueError):
+        connect(path, graphs=['knows'], profile='readonly')
+    graph = connect(path, graphs=['knows'])
+    with pytest.raises(ValueError):
+        graph.transaction(profile='readonly')
+    graph.close()
+    snapshot = connect(path, readonly=True, profile='readonly')
+    assert snapshot.find(V(1).knows).to(list) == []
+    snapshot.close()
+
+
+def test_adjacency_cache():
+    graph = connect(':memory:', graphs=['knows'], adjacency_cache=10)
+    with graph.transaction() as tr:
+        tr.store_many(V(1).knows(n) for n in (2, 3))
+
+    cached = graph.find(V(1).knows).to(tuple)
+    assert cached == (2, 3)
+    assert graph.find(V(1).knows).to(tuple) is cached
+    assert graph.find(V(1).knows).to(list) == [2, 3]
+    assert graph.find(V().knows(2)).to(list) == [1]
+    assert graph.adjacency.stats()['hits'] == 2
+
+    with graph.transaction() as tr:
+        tr.store(V(1).knows(4))
+    assert graph.find(V(1).knows).to(list) == [2, 3, 4]
+    assert graph.find(V().knows(2)).to(list) == [1]
+
+    with graph.transaction() as tr:
+        tr.delete(V(1).knows)
+    assert graph.find(V(1).knows).to(list) == []
+    assert graph.find(V().knows(2)).to(list) == []
+
+    stats = graph.adjacency.stats()
+    assert stats['items'] == 2
+    assert stats['bytes'] > 0
+    assert 0 < stats['hit_rate'] < 1
+    graph.close()
+
+
+def test_degree(graph):
+    assert graph.degree(1, 'knows') == 3
+    assert graph.degree(1, 'knows', 'in') == 2
+    assert graph.degree(1, 'knows', 'both') == 5
+    assert graph.degree(9, 'knows') == 0
+    assert graph.top_degrees('knows', 1, 'both') == [(1, 5)]
+    with pytest.raises(ValueError):
+        graph.degree(1, 'knows', 'sideways')
+
+
+@pytest.mark.parametrize('layout', ['rowid', 'clustered'])
+def test_degree_tables(tmpdir, layout):
+    path = str(tmpdir.join('degrees.db'))
+    plain = connect(path, graphs=['knows'], layout=layout)
+    with plain.transaction() as tr:
+        tr.store_many(V(1).knows(n) for n in (2, 3, 4))
+    plain.close()
+
+    graph = connect(path, graphs=['knows'], layout=layout, degrees=True)
+    assert graph.degree(1, 'knows') == 3
+
+    with graph.transaction() as tr:
+        tr.store_many([V(1).knows(5), V(1).knows(5), V(2).knows(5)])
+        tr.delete(V(1).knows(2))
+    degree = 4 if layout == 'rowid' else 3
+    assert graph.degree(1, 'knows') == degree
+    assert graph.top_degrees('knows', 2) == [(1, degree), (2, 1)]
+    assert graph.top_degrees('knows', 1, 'in') == [(5, degree - 1)]
+
+    with graph.transaction() as tr:
+        tr.delete(V(1).knows)
+    assert graph.degree(1, 'knows') == 0
+    assert graph.degree(5, 'knows', 'in') == 1
+    assert graph.db.execute(
+        'SELECT COUNT(*) FROM knows_degree').fetchone() == (2,)
+
+    graph.bulk_load(V(3).knows(n) for n in range(10))
+    assert graph.top_degrees('knows', 1) == [(3, 10)]
+    assert graph.degree(5, 'knows', 'in') == 2
+    graph.close()
+
+
+def test_edge_properties_schema(tmpdir):
+    path = str(tmpdir.join('props.db'))
+    connect(path, graphs=['knows']).close()
+
+    graph = connect(path, graphs={'knows': {'since': 'INTEGER'}})
+    columns = [row[1] for row in graph.db.execute('PRAGMA table_info(knows)')]
+    assert columns == ['src', 'dst', 'since']
+    plan = graph.find(V(1).knows.where(since__gt=5)).explain()
+    assert 'knows_src_since' in plan[0].detail
+    graph.close()
+
+    with pytest.raises(ValueError):
+        connect(':memory:', graphs={'knows': {'since': 'DATETIME'}})
+    with pytest.raises(ValueError):
+        connect(':memory:', graphs={'knows': {'src': 'INTEGER'}})
+
+
+def test_relation_registry(tmpdir):
+    path = str(tmpdir.join('registry.db'))
+    graphs = {'knows': {}, 'follows': {'since': 'INTEGER'}}
+    graph = connect(path, graphs=graphs)
+    assert graph.relations == ['follows', 'knows']
+    graph.close()
+
+    executions = []
+    graph = connect(path, graphs=['knows'])
+    graph.hooks.add(executions.append)
+    graph.setup_sql(['knows'])
+    assert graph.relations == ['follows', 'knows']
+    # only the registry is read
+    assert [execution.sql for execution in executions] == [
+        SQL.SELECT_TABLES, SQL.SELECT_RELATIONS]
+    graph.close()
+
+    graph = connect(path, graphs=['knows'], degrees=True)
+    assert graph.degree(1, 'knows') == 0
+    graph.close()
+
+    with pytest.raises(ValueError):
+        connect(path, graphs=['graphlite_nodes'])
+
+
+def test_create_relations():
+    graph = connect(':memory:', graphs=['knows'], create_relations=True,
+                    degrees=True)
+    with graph.transaction() as tr:
+        tr.store(V(1).knows(2))
+        tr.store(V(1).follows(2))
+    assert graph.find(V(1).follows).to(list) == [2]
+    assert graph.degree(1, 'follows') == 1
+    assert graph.relations == ['follows', 'knows']
+
+    def edges():
+        yield V(1).likes(2)
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        with graph.transaction() as tr:
+            tr.store_many(edges())
+    assert graph.relations == ['follows', 'knows']
+    with pytest.raises(OperationalError):
+        graph.find(V(1).likes).to(list)
+
+    with pytest.raises(ValueError):
+        with graph.transaction() as tr:
+            tr.store(V(1).sqlite_master(2))
+
+
+def test_layout_detected(tmpdir):
+    clustered = str(tmpdir.join('clustered.db'))
+    connect(clustered, graphs=['knows'], layout='clustered').close()
+    graph = connect(clustered, graphs=['knows'])
+    with graph.transaction() as tr:
+        tr.store(V(1).knows(2))
+        tr.store(V(1).knows(2))
+    assert graph.find(V(1).knows).to(list) == [2]
+    graph.close()
+
+    rowid = str(tmpdir.join('rowid.db'))
+    graphs = {'rates': {'score': 'INTEGER'}}
+    connect(rowid, graphs=graphs).close()
+    graph = connect(rowid, graphs=graphs, layout='clustered')
+    with graph.transaction() as tr:
+        tr.store(V(1).rates(2, score=1))
+        tr.store(V(1).rates(2, score=2))
+    assert graph.find(V(1).rates).count() == 2
+    graph.close()
+
+
+def test_readonly_uri():
+    assert readonly_uri('/data/graph.db') == 'file:/data/graph.db?mode=ro'
+    assert readonly_uri('file:///data/my%20graph.db?cache=private&mode=rw',
+                        immutable=True) == \
+        'file:/data/my%20graph.db?cache=private&mode=ro&immutable=1'
+    assert readonly_uri('file://localhost/data/graph.db') == \
+        'file:/data/graph.db?mode=ro'
@@ -0,0 +1,62 @@
+import logging
+from graphlite import connect, V
+from graphlite.hooks import SlowQueryLog
+
+
+def test_query_hooks(graph):
+    executions = []
+    graph.hooks.add(executions.append)
+    assert list(graph.find(V(1).knows)) == [2, 3, 4]
+    assert V(1).knows(2) in graph
+
+    query, contains = executions
+    assert query.sql == graph.find(V(1).knows).statement
+    assert (query.params, query.rows) == (1, 3)
+    assert query.seconds >= 0
+    assert (contains.params, contains.rows) == (2, 1)
+
+
+def test_transaction_hooks(graph):
+    executions = []
+    graph.hooks.add(executions.append)
+    with graph.transaction() as tr:
+        tr.store_many([V(5).knows(6), V(6).knows(7)])
+        tr.delete(V(1).likes)
+
+    store, delete = executions
+    assert store.sql.startswith('INSERT')
+    assert (store.params, store.rows) == (2, 2)
+    assert (delete.params, delete.rows) == (1, 2)
+
+
+
+def test_transaction_setup_hooks():
+    g = connect(':memory:', graphs=['knows'], intern_nodes=True,
+                create_relations=True)
+    executions = []
+    g.hooks.add(executions.append)
+    with g.transaction() as tr:
+        tr.store(V('alice').follows('bob'))
+
+    # the relation is created, then the nodes are interned
+    statements = [execution.sql for execution in executions]
+    assert statements[0].startswith('CREATE TABLE IF NOT EXISTS follows')
+    assert 'graphlite_relations' in statements[3]
+    assert statements[4].startswith('INSERT OR IGNORE INTO graphlite_nodes')
+    assert 'FROM graphlite_nodes' in statements[5]
+    assert statements[6].startswith('INSERT INTO follows')
+    g.close()
+
+def test_slow_query_log(caplog):
+    g = connect(':memory:', graphs=['knows'], slow_query=0)
+    with caplog.at_level(logging.WARNING, logger='graphlite.slow'):
+        assert g.find(V(1).knows).count() == 0
+    assert 'SELECT COUNT(*)' in caplog.text
+
+    log = SlowQueryLog(threshold=60)
+    with caplog.at_level(logging.WARNING, logger='graphlite.slow'):
+        caplog.clear()
+        g.hooks.add(log)
+        g.hooks.remove(g.hooks.callbacks[0])
+        g.find(V(1).knows).to(list)
+    assert not caplog.text
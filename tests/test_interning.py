@@ -0,0 +1,179 @@
+import pytest
+from graphlite import connect, V
+from graphlite.interning import Interner, UNKNOWN
+
+
+ALICE = '6f1c2a4e-0b8d-4d52-9a55-1c0e0f6c1a01'
+BOB = 'a3e4b8c2-7d1f-4f0e-8b9a-2d6c5e4f3b02'
+CAROL = 'c9d8e7f6-5a4b-4c3d-9e2f-1a0b9c8d7e03'
+DAVE = 'e1f2a3b4-c5d6-4e7f-8a9b-0c1d2e3f4a04'
+
+
+@pytest.fixture
+def interned(request):
+    g = connect(':memory:', graphs=['knows', 'likes'], intern_nodes=True,
+                degrees=True)
+    with g.transaction() as tr:
+        for dst in (BOB, CAROL, DAVE):
+            tr.store(V(ALICE).knows(dst))
+        tr.store(V(BOB).knows(ALICE))
+        tr.store(V(CAROL).knows(ALICE))
+        tr.store(V(ALICE).likes(BOB))
+        tr.store(V(ALICE).likes(CAROL))
+    request.addfinalizer(g.close)
+    return g
+
+
+def test_edges_store_ids(interned):
+    rows = interned.db.execute('SELECT src, dst FROM knows').fetchall()
+    assert all(isinstance(n, int) for row in rows for n in row)
+    keys = interned.db.execute('SELECT key FROM graphlite_nodes')
+    assert set(row[0] for row in keys) == set([ALICE, BOB, CAROL, DAVE])
+
+
+def test_queries(interned):
+    g = interned
+    assert g.find(V(ALICE).knows).to(set) == set([BOB, CAROL, DAVE])
+    assert g.find(V().knows(ALICE)).to(set) == set([BOB, CAROL])
+    assert V(ALICE).knows(BOB) in g
+    assert V(BOB).knows(CAROL) not in g
+    assert V('unknown').knows(BOB) not in g
+    assert g.find(V('unknown').knows).to(list) == []
+
+    query = g.find(V(ALICE).knows).intersection(V(ALICE).likes)
+    assert query.to(set) == set([BOB, CAROL])
+    query = g.find(V(ALICE).knows).difference(V(ALICE).likes)
+    assert query.to(list) == [DAVE]
+
+    query = g.find(V(BOB).knows).traverse(V().likes)
+    assert query.to(set) == set([BOB, CAROL])
+    query = g.find(V(ALICE).knows).traverse(V().knows(ALICE))
+    assert query.to(set) == set([BOB, CAROL])
+    assert g.find(V(ALICE).knows).first() in (BOB, CAROL, DAVE)
+    assert g.find(V(ALICE).knows).count() == 3
+    assert g.find(V(DAVE).knows).first() is None
+
+
+def test_reachability(interned):
+    g = interned
+    depths = g.find(V(BOB).knows).depths(V().knows)
+    assert depths == {ALICE: 2, BOB: 1, CAROL: 1, DAVE: 1}
+    assert g.shortest_path(BOB, DAVE, 'knows') == [BOB, ALICE, DAVE]
+
+    neighbors = g.neighbors_many([ALICE, DAVE], 'knows')
+    assert sorted(neighbors[ALICE]) == sorted([BOB, CAROL, DAVE])
+    assert neighbors[DAVE] == []
+
+
+def test_degrees(interned):
+    assert interned.degree(ALICE, 'knows') == 3
+    assert interned.degree(ALICE, 'knows', direction='in') == 2
+    assert interned.degree('unknown', 'knows') == 0
+    assert interned.top_degrees('knows', 1) == [(ALICE, 3)]
+
+
+def test_page(interned):
+    query = interned.find(V(ALICE).knows)
+    first = query.page(size=2)
+    second = query.page(after=first.token, size=2)
+    assert first.items + second.items == [BOB, CAROL, DAVE]
+    assert second.token is None
+
+
+def test_delete(interned):
+    with interned.transaction() as tr:
+        tr.delete(V(ALICE).knows(BOB))
+        tr.delete(V().likes(CAROL))
+        tr.delete(V('unknown').knows)
+    assert interned.find(V(ALICE).knows).to(set) == set([CAROL, DAVE])
+    assert interned.find(V(ALICE).likes).to(list) == [BOB]
+    count = interned.db.execute('SELECT COUNT(*) FROM graphlite_nodes')
+    assert count.fetchone()[0] == 4
+
+
+def test_rollback_clears_cache(interned):
+    def edges():
+        yield V('eve').knows('frank')
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        with interned.transaction() as tr:
+            tr.store_many(edges())
+    assert interned.interner.ids.get('eve') is None
+    assert V('eve').knows('frank') not in interned
+
+    with interned.transaction() as tr:
+        tr.store(V('eve').knows('frank'))
+    assert interned.find(V('eve').knows).to(list) == ['frank']
+
+
+def test_adjacency_cache():
+    g = connect(':memory:', graphs=['knows'], intern_nodes=True,
+                adjacency_cache=16)
+    with g.transaction() as tr:
+        tr.store(V(ALICE).knows(BOB))
+    assert g.find(V(ALICE).knows).to(tuple) == (BOB,)
+    with g.transaction() as tr:
+        tr.store(V(ALICE).knows(CAROL))
+    assert sorted(g.find(V(ALICE).knows).to(tuple)) == [BOB, CAROL]
+
+
+def test_parallel(tmpdir):
+    path = str(tmpdir.join('interned.db'))
+    g = connect(path, graphs=['knows'], intern_nodes=True)
+    with g.transaction() as tr:
+        tr.store(V(ALICE).knows(BOB))
+        tr.store(V(BOB).knows(CAROL))
+        tr.store(V(BOB).knows(DAVE))
+    query = g.find(V(ALICE).knows).traverse(V().knows)
+    assert query.parallel(processes=2) == set([CAROL, DAVE])
+    g.close()
+
+
+def test_interner():
+    g = connect(':memory:', graphs=['knows'], intern_nodes=True)
+    interner = Interner(maxsize=2, chunk=2)
+    with g.db:
+        ids = interner.encode(g.db, ['a', 'b', 'c', 'a', None], create=True)
+    assert ids[0] == ids[3] and None not in ids[:4] and ids[4] is None
+    assert interner.encode(g.db, ['d']) == [UNKNOWN]
+
+    interner.clear()
+    assert interner.decode(g.db, ids[:3]) == ['a', 'b', 'c']
+    assert len(interner.keys.data) == 2
+
+
+def test_staged_delete(interned):
+    with interned.transaction() as tr:
+        tr.store_many(V('user%d' % n).knows(ALICE) for n in range(100))
+    with interned.transaction() as tr:
+        tr.delete_many(V('user%d' % n).knows for n in range(0, 120, 2))
+        tr.delete_query(interned.find(V(BOB).knows), 'likes')
+    assert interned.find(V().knows(ALICE)).count() == 52
+    assert interned.find(V(ALICE).likes).to(list) == []
+
+
+def test_interning_mode(tmpdir):
+    plain = str(tmpdir.join('plain.db'))
+    g = connect(plain, graphs=['knows'])
+    with g.transaction() as tr:
+        tr.store(V(1).knows(2))
+    g.close()
+    with pytest.raises(ValueError):
+        connect(plain, graphs=['knows'], intern_nodes=True)
+    with pytest.raises(ValueError):
+        connect(plain, readonly=True, intern_nodes=True)
+
+    interned = str(tmpdir.join('interned.db'))
+    g = connect(interned, graphs=['knows'], intern_nodes=True)
+    with g.transaction() as tr:
+        tr.store(V(ALICE).knows(BOB))
+    g.close()
+    with pytest.raises(ValueError):
+        connect(interned, graphs=['knows'])
+    with pytest.raises(ValueError):
+        connect(interned, readonly=True)
+
+    g = connect(interned, readonly=True, intern_nodes=True)
+    assert g.find(V(ALICE).knows).to(list) == [BOB]
+    g.close()
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+from graphlite import connect, V
+from graphlite.pool import ConnectionPool
+
+
+def test_pool_stats():
+    pool = ConnectionPool(object, 2)
+
+    with pool.connection() as a:
+        with pool.connection() as b:
+            assert a is not b
+        with pool.connection() as c:
+            assert c is b
+
+    assert pool.stats() == {
+        'size': 2,
+        'open': 2,
+        'idle': 2,
+        'checkouts': 3,
+        'waits': 0,
+    }
+
+
+def test_pool_memory():
+    with pytest.raises(ValueError):
+        connect(':memory:', graphs=['knows'], pool_size=2)
+
+
+def test_pooled_graph(tmpdir):
+    graph = connect(str(tmpdir.join('graph.db')), graphs=['knows'],
+                    pool_size=4)
+    assert graph.db.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+
+    with graph.transaction() as tr:
+        tr.store_many(V(1).knows(n) for n in range(2, 102))
+
+    results = []
+
+    def worker():
+        for __ in range(20):
+            results.append(graph.find(V(1).knows).count())
+            assert V(1).knows(2) in graph
+
+    threads = [threading.Thread(target=worker) for __ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [100] * 160
+    stats = graph.pool.stats()
+    assert stats['open'] <= 4
+    assert stats['checkouts'] == 320
+    graph.close()
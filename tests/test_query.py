@@ -1,4 +1,8 @@
-from graphlite import V
+from random import Random
+
+import pytest
+from graphlite import connect, V
+from graphlite.query import JOIN, NESTED
 
 
 def test_find(graph):
@@ -35,6 +39,33 @@ def test_nested_traverse(graph):
     assert query.to(list) == [2, 3, 4]
 
 
+@pytest.mark.parametrize('strategy', [JOIN, NESTED])
+def test_traverse_strategy(graph, strategy):
+    query = graph.find(V(1).knows)\
+                 .union(V(1).likes)\
+                 .traverse(V().knows, strategy=strategy)\
+                 .traverse(V().knows(4), strategy=strategy)
+    assert query.to(list) == [1]
+
+
+def test_traverse_plan(graph):
+    query = graph.find(V(1).likes)\
+                 .traverse(V().knows, strategy=JOIN)\
+                 .traverse(V().knows, strategy=JOIN)
+    assert len(query.plan) == 2
+    assert query.plan[0].startswith('WITH hop1(id) AS')
+    assert 'hop2(id) AS' in query.plan[0]
+    assert query.statement == '\n'.join(query.plan)
+
+    nested = graph.find(V(1).likes).traverse(V().knows)
+    assert nested.plan == nested.sql
+
+
+def test_traverse_unknown_strategy(graph):
+    with pytest.raises(ValueError):
+        graph.find(V(1).knows).traverse(V().knows, strategy='hash')
+
+
 def test_count(graph):
     assert graph.find(V(1).knows).count() == 3
     assert graph.find(V(1).likes).count() == 2
@@ -63,3 +94,263 @@ def test_hashable():
 
     assert d[V(1).knows(2)] == 5
     assert V(1).knows(3) not in d
+
+
+def test_traverse_until(graph):
+    assert graph.find(V(1).likes)\
+                .traverse_until(V().knows).to(set) == set((1, 2, 3, 4))
+    assert graph.find(V(2).knows)\
+                .traverse_until(V().knows, depth=1).to(list) == [2, 3, 4]
+    assert graph.find(V().knows(4))\
+                .traverse_until(V().knows, inverse=True).to(set) == \
+        set((1, 2, 3))
+
+
+def test_traverse_until_depth(graph):
+    with pytest.raises(ValueError):
+        graph.find(V(1).knows).traverse_until(V().knows, depth=0)
+
+
+def test_depths(graph):
+    query = graph.find(V(2).knows)
+    assert query.depths(V().knows) == {1: 2, 2: 1, 3: 1, 4: 1}
+    assert query.depths(V().knows, depth=1) == {2: 1, 3: 1, 4: 1}
+
+
+def test_depths_dense_cycles():
+    graph = connect(':memory:', graphs=['knows'])
+    random = Random(7)
+    edges = [(n, (n + 1) % 300) for n in range(300)] + [
+        (random.randrange(300), random.randrange(300)) for __ in range(2700)
+    ]
+    with graph.transaction() as tr:
+        tr.store_many(V(src).knows(dst) for src, dst in edges)
+
+    expected = {}
+    frontier = set(dst for src, dst in edges if src == 0)
+    level = 0
+    while frontier:
+        level += 1
+        frontier = set(dst for src, dst in edges
+                       if src in frontier and dst not in expected)
+        for node in frontier:
+            expected[node] = level
+
+    # the seeds, then a query per level which reads the edges of
+    # every node once, instead of once per path to it
+    executions = []
+    graph.hooks.add(executions.append)
+    assert graph.find(V(0).knows).depths(V().knows) == expected
+    assert len(executions) <= max(expected.values()) + 2
+    assert sum(execution.rows for execution in executions) < 2 * len(edges)
+    graph.close()
+
+
+def test_count_compound(graph):
+    assert graph.find(V(1).knows).traverse(V().knows).count() == 2
+    assert graph.find(V(1).knows).union(V(1).likes).count() == 3
+    assert graph.find(V(1).knows).difference(V().knows(1)).count() == 1
+    assert graph.find(V(4).knows).count() == 0
+
+
+def test_exists(graph):
+    assert graph.find(V(1).knows).exists()
+    assert not graph.find(V(4).knows).exists()
+    assert graph.find(V(1).likes).traverse(V().knows).exists()
+    assert not graph.find(V(1).knows)\
+                    .intersection(V(4).knows).exists()
+
+
+def test_first(graph):
+    assert graph.find(V(1).knows).first() == 2
+    assert graph.find(V(1).knows).difference(V().knows(1)).first() == 4
+    assert graph.find(V(4).knows).first() is None
+
+
+def test_page(graph):
+    query = graph.find(V(1).knows)
+    first = query.page(size=2)
+    assert first.items == [2, 3]
+
+    second = query.page(after=first.token, size=2)
+    assert second.items == [4]
+    assert second.token is None
+
+
+def test_page_traverse(graph):
+    query = graph.find(V(1).knows).traverse(V().knows)
+    page = query.page(size=1)
+    assert page.items == [1]
+    assert query.page(after=page.token, size=1) == ([], None)
+
+
+def test_page_invalid_token(graph):
+    with pytest.raises(ValueError):
+        graph.find(V(1).knows).page(after='not a token')
+
+
+def test_page_invalid_size(graph):
+    for size in (0, -1):
+        with pytest.raises(ValueError):
+            graph.find(V(1).knows).page(size=size)
+
+
+def test_batches(graph):
+    assert list(graph.find(V(1).knows).batches(2)) == [[2, 3], [4]]
+    assert list(graph.find(V(4).knows).batches(2)) == []
+
+
+def test_to_array(graph):
+    nodes = graph.find(V(1).knows).to_array()
+    assert nodes.typecode == 'Q'
+    assert nodes.tolist() == [2, 3, 4]
+
+
+@pytest.mark.parametrize('strategy', [JOIN, NESTED])
+def test_parallel(tmpdir, strategy):
+    graph = connect(str(tmpdir.join('graph.db')), graphs=['knows'])
+    graph.bulk_load(V(n).knows(n * 7 % 50) for n in range(50))
+    graph.bulk_load(V(0).knows(n) for n in range(50))
+
+    query = graph.find(V(0).knows).traverse(V().knows, strategy=strategy)
+    assert query.parallel(processes=3) == set(query)
+
+    inverse = graph.find(V(0).knows).traverse(V().knows(0),
+                                              strategy=strategy)
+    assert inverse.parallel(processes=2) == set(inverse) == set((0,))
+    graph.close()
+
+
+def test_parallel_file_uri(tmpdir):
+    path = str(tmpdir.join('graph.db'))
+    graph = connect('file:%s?cache=private' % path, graphs=['knows'])
+    with graph.transaction() as tr:
+        tr.store(V(1).knows(2))
+        tr.store(V(2).knows(3))
+    query = graph.find(V(1).knows).traverse(V().knows)
+    assert query.parallel(processes=2) == set([3])
+    graph.close()
+
+
+def test_parallel_requires_traversal(graph):
+    with pytest.raises(ValueError):
+        graph.find(V(1).knows).parallel()
+    with pytest.raises(ValueError):
+        graph.find(V(1).knows).traverse(V().knows).parallel()
+
+
+def test_explain(graph):
+    plan = graph.find(V(1).knows).explain()
+    assert len(plan) == 1
+    assert plan[0].parent == 0
+    assert 'knows_src_dst' in plan[0].detail
+
+
+def test_set_operation_chains(graph):
+    with graph.transaction() as tr:
+        tr.store_many(V(i).knows(1) for i in range(5, 10))
+        tr.store_many(V(1).likes(i) for i in (4, 5, 6))
+
+    # the big operand is scanned first, then the small one
+    big = graph.find(V().knows(1)).intersection(V(1).likes)
+    small = graph.find(V(1).likes).intersection(V().knows(1))
+    assert big.to(list) == small.to(list) == [2, 3, 5, 6]
+    assert big.count() == 4
+
+    chain = graph.find(V().knows(1)).intersection(V(1).likes)\
+                                    .difference(V(1).knows)
+    assert chain.to(list) == [5, 6]
+    assert chain.union(V(1).knows).to(list) == [2, 3, 4, 5, 6]
+    assert list(chain.traverse(V().knows)) == [1, 1]
+
+    empty = graph.find(V(1).knows).intersection(V().knows(4))
+    assert empty.to(list) == []
+    assert not empty.exists()
+
+
+@pytest.fixture(params=['rowid', 'clustered'])
+def weighted(request):
+    graph = connect(':memory:', layout=request.param, graphs={
+        'follows': {'created': 'integer', 'weight': 'REAL'},
+    })
+    with graph.transaction() as tr:
+        tr.store_many(V(1).follows(n, created=n * 10, weight=1.0 / n)
+                      for n in range(2, 8))
+        tr.store(V(3).follows(1, created=5, weight=0.5))
+        tr.store(V(4).follows(1, created=70, weight=2.0))
+    request.addfinalizer(graph.close)
+    return graph
+
+
+def test_edge_values():
+    edge = V(1).knows(2, weight=0.5)
+    assert edge._values == (('weight', 0.5),)
+    assert edge == V(1).knows(2) == (1, 'knows', 2)
+    src, rel, dst = edge.where(weight__gt=0)
+    assert (src, rel, dst) == (1, 'knows', 2)
+    assert V(1).filters(2) == (1, 'filters', 2)
+    assert V(1).where.rel == 'where'
+    assert V(1).order_by(2) == (1, 'order_by', 2)
+    assert V(1).knows.where(weight=1)(2)._filters == \
+        (('weight', 'eq', 1),)
+    assert repr(edge) == '(1)-[:knows {weight: 0.5}]->(2)'
+    with pytest.raises(ValueError):
+        V(1).knows(2, **{'x; DROP TABLE knows': 1})
+    with pytest.raises(ValueError):
+        V(1).knows.where(weight__between=1)
+
+
+def test_edge_filters(weighted):
+    recent = V(1).follows.where(created__gte=30, created__lt=60)
+    assert weighted.find(recent).to(list) == [3, 4, 5]
+    assert weighted.find(V(1).follows.where(created=20)).to(list) == [2]
+    assert V(1).follows(7).where(weight__lt=0.2) in weighted
+    assert V(1).follows(2).where(weight__lt=0.2) not in weighted
+
+    top = weighted.find(V().follows(1).order_by('-weight'))
+    assert list(top[:1]) == [4]
+    latest = weighted.find(V(1).follows.order_by('-created'))
+    assert list(latest[:2]) == [7, 6]
+
+    # filtered edge queries are not planned or cached
+    query = weighted.find(V(1).follows).intersection(
+        V().follows(1).where(created__gt=10))
+    assert query.to(list) == [4]
+
+
+def test_edge_filters_traverse(weighted):
+    old = V().follows.where(created__lt=40)
+    for strategy in (JOIN, NESTED):
+        query = weighted.find(V().follows(1)).traverse(old, strategy)
+        assert list(query) == [1]
+    assert set(weighted.find(V(3).follows).traverse_until(
+        V().follows.where(created__lt=40))) == set([1, 2, 3])
+    assert weighted.find(V(4).follows).depths(
+        V().follows.where(weight__gte=0.5), depth=3) == {2: 1}
+
+
+def test_edge_ordering_set_operations(weighted):
+    ordered = V(1).follows.order_by('-created')
+    with pytest.raises(ValueError):
+        weighted.find(V(3).follows).intersection(ordered)
+    with pytest.raises(ValueError):
+        weighted.find(V(3).follows).union(ordered)
+    with pytest.raises(ValueError):
+        weighted.find(ordered).difference(V(3).follows)
+    for strategy in (JOIN, NESTED):
+        query = weighted.find(V().follows(1)).traverse(ordered, strategy)
+        with pytest.raises(ValueError):
+            query.intersection(V(3).follows)
+    query = weighted.find(V(3).follows).traverse(ordered)
+    assert list(query[:2]) == [7, 6]
+
+
+def test_edge_filters_delete(weighted):
+    with weighted.transaction() as tr:
+        tr.delete(V(1).follows.where(created__gt=40))
+    assert weighted.find(V(1).follows).to(set) == set([2, 3, 4])
+
+    with weighted.transaction() as tr:
+        tr.store(V(1).follows(2, created=99, weight=0.0))
+    edges = weighted.find(V(1).follows.where(created=99)).to(list)
+    assert edges == [2]
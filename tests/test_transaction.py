@@ -1,6 +1,7 @@
 import pytest
-from graphlite import V
+from graphlite import connect, V
 from graphlite.transaction import AbortSignal
+import graphlite.sql as SQL
 from sqlite3 import OperationalError
 
 
@@ -77,3 +78,183 @@ def test_transaction_isolation(graph):
     with graph.transaction() as tr:
         tr.store(V(1).knows(5))
         assert V(1).knows(5) not in graph
+
+
+def test_transaction_many_relations(graph):
+    edges = [V(5).knows(6), V(5).knows(7), V(5).likes(6), V(5).knows(8)]
+
+    with graph.transaction() as tr:
+        tr.store_many(iter(edges))
+
+    assert graph.find(V(5).knows).to(list) == [6, 7, 8]
+    assert graph.find(V(5).likes).to(list) == [6]
+
+    with graph.transaction() as tr:
+        tr.delete_many(iter([V(5).knows(6), V(5).likes, V().knows(8)]))
+
+    assert graph.find(V(5).knows).to(list) == [7]
+    assert graph.find(V(5).likes).to(list) == []
+
+
+def test_transaction_clustered():
+    graph = connect(':memory:', graphs=['knows'], layout='clustered')
+
+    with graph.transaction() as tr:
+        tr.store_many(V(1).knows(n) for n in (2, 3, 2, 3))
+        tr.store(V(1).knows(2))
+
+    assert graph.find(V(1).knows).to(list) == [2, 3]
+    graph.close()
+
+
+def test_transaction_profile(graph):
+    pragma = lambda name: graph.db.execute('PRAGMA %s' % name).fetchone()[0]
+    seen = []
+
+    class Tracking(list):
+        def __iter__(self):
+            seen.append(pragma('synchronous'))
+            return list.__iter__(self)
+
+    with graph.transaction(profile='bulk') as tr:
+        tr.store_many(Tracking([V(1).knows(9)]))
+
+    assert seen == [0]
+    assert pragma('synchronous') == 2
+    assert V(1).knows(9) in graph
+
+
+def test_transaction_profile_journal(tmpdir):
+    graph = connect(str(tmpdir.join('graph.db')), graphs=['knows'])
+    pragma = lambda name: graph.db.execute('PRAGMA %s' % name).fetchone()[0]
+    for profile in ('fast', 'durable', 'bulk'):
+        with graph.transaction(profile=profile) as tr:
+            tr.store(V(1).knows(2))
+        assert pragma('journal_mode') == 'delete'
+    assert not tmpdir.join('graph.db-wal').check()
+    graph.close()
+
+
+def test_streaming_transaction(graph):
+    progress = []
+    consumed = []
+
+    def edges():
+        for n in range(10, 15):
+            consumed.append(n)
+            yield V(5).knows(n)
+
+    with graph.transaction(flush_every=2, progress=progress.append) as tr:
+        tr.store_many(edges())
+        assert consumed == [10, 11, 12, 13, 14]
+        assert tr.pending == 1
+        tr.delete(V(1).likes)
+        assert tr.pending == 0
+        tr.delete_query(graph.find(V(1).knows), 'knows', inverse=True)
+        assert tr.pending == 1
+
+    assert progress == [2, 4, 6, 7]
+    assert graph.find(V(5).knows).to(list) == [10, 11, 12, 13, 14]
+    assert graph.find(V(1).likes).to(list) == []
+    assert graph.find(V().knows(2)).to(list) == []
+
+
+def test_streaming_transaction_rollback(graph):
+    def edges():
+        for n in range(10, 15):
+            yield V(5).knows(n)
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        with graph.transaction(flush_every=2) as tr:
+            tr.store_many(edges())
+    assert graph.find(V(5).knows).to(list) == []
+
+    with graph.transaction(flush_every=2) as tr:
+        tr.store_many([V(5).knows(1), V(5).knows(2)])
+        tr.abort()
+    assert graph.find(V(5).knows).to(list) == []
+
+
+def test_streaming_transaction_checkpoint(graph):
+    def edges():
+        for n in range(10, 15):
+            yield V(5).knows(n)
+        raise RuntimeError
+
+    progress = []
+    with pytest.raises(RuntimeError):
+        with graph.transaction(flush_every=2, checkpoint=True,
+                               progress=progress.append) as tr:
+            tr.store_many(edges())
+    assert progress == [2, 4]
+    assert graph.find(V(5).knows).to(list) == [10, 11, 12, 13]
+
+
+def test_streaming_transaction_savepoint(graph):
+    with graph.transaction(flush_every=2) as tr:
+        tr.store_many([V(5).knows(6), V(5).knows(7)])
+        with pytest.raises(OperationalError):
+            tr.store_many([V(5).knows(8), V(5).does(9)])
+        tr.store(V(5).knows(10))
+
+    assert graph.find(V(5).knows).to(list) == [6, 7, 10]
+
+
+def test_staged_delete(graph):
+    with graph.transaction() as tr:
+        tr.store_many(V(n).knows(n + 1) for n in range(10, 210))
+        tr.store_many(V(n).likes(1) for n in range(10, 210))
+
+    executions = []
+    graph.hooks.add(executions.append)
+    with graph.transaction() as tr:
+        tr.delete_many(
+            [V(n).knows(n + 1) for n in range(10, 50)] +
+            [V(n).knows for n in range(50, 90)] +
+            [V().knows(n + 1) for n in range(90, 130)] +
+            [V(n).likes for n in range(10, 200)]
+        )
+    # staged, a delete per relation and shape, cleared
+    statements = [execution.sql for execution in executions]
+    assert statements[:4] == list(SQL.STAGE_DELETES) + [
+        SQL.INSERT_STAGED, SQL.SELECT_STAGED_SHAPES]
+    assert len(statements) == 9 and statements[-1] == SQL.CLEAR_STAGED
+
+    assert graph.find(V(130).knows).to(list) == [131]
+    assert graph.find(V(129).knows).to(list) == []
+    assert graph.find(V().likes(1)).to(set) == set(range(200, 210))
+    assert graph.find(V(1).knows).to(list) == [2, 3, 4]
+
+
+def test_staged_delete_filtered():
+    graph = connect(':memory:', graphs={'rates': {'score': 'INTEGER'}},
+                    degrees=True)
+    with graph.transaction() as tr:
+        tr.store_many(V(1).rates(n, score=n % 2) for n in range(100))
+    with graph.transaction() as tr:
+        tr.delete_many([V(1).rates.where(score=0)] +
+                       [V(1).rates(n) for n in range(1, 100, 4)])
+    assert graph.find(V(1).rates).count() == 25
+    assert graph.degree(1, 'rates') == 25
+    graph.close()
+
+
+def test_delete_query(graph):
+    with graph.transaction() as tr:
+        tr.store(V(4).likes(1))
+        tr.store(V(5).knows(4))
+
+    # everyone 1 knows loses every edge of theirs, the query
+    # is ran after the deletes before it
+    friends = graph.find(V(1).knows)
+    with graph.transaction() as tr:
+        tr.delete_query(friends, 'likes')
+        tr.delete_query(friends, 'knows')
+        tr.delete_query(friends, 'knows', inverse=True)
+
+    assert graph.find(V(1).knows).to(list) == []
+    assert graph.find(V(5).knows).to(list) == []
+    assert graph.find(V().knows(1)).to(list) == []
+    assert graph.find(V(1).likes).to(list) == [2, 3]
+    assert graph.find(V(4).likes).to(list) == []